@@ -0,0 +1,173 @@
+"""
+File: bench_engine.py
+
+Compares a plain create_engine() with storage.get_engine() in two modes:
+
+- sequential: the workload the bot puts on SQLite, small committed writes and point
+  reads, one Session each, all run on the database thread through runs_in_db_thread.
+  Also counts how many connections each engine opens, i.e. how often the pragmas are
+  applied.
+- concurrent: one writer thread and three reader threads working on the same file at
+  once, e.g. the crawl writing while a second process or a backup reads. Counts the
+  operations that failed with "database is locked" and the slowest operation.
+
+The databases are created in a temporary directory. Run it from the repository root:
+
+    python benchmarks/bench_engine.py [operations] [seconds]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import Column, Integer, String, create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import get_engine, runs_in_db_thread  # noqa: E402
+
+Base = declarative_base()
+ROWS = 1000
+READERS = 3
+
+
+class Row(Base):
+    __tablename__ = 'rows'
+    id = Column(Integer, primary_key=True)
+    value = Column(String)
+
+
+def prepare(engine):
+    """
+    :param engine: The engine to benchmark
+    :return: A tuple of (blocking write(i) function, blocking read(i) function)
+    """
+    Session = sessionmaker(bind=engine)
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(Row.__table__.insert(),
+                           [{'id': i, 'value': ''} for i in range(ROWS)])
+
+    def write(i):
+        session = Session()
+        try:
+            session.query(Row).filter(Row.id == i % ROWS).update(
+                {Row.value: str(i)}, synchronize_session=False)
+            session.commit()
+        finally:
+            session.close()
+
+    def read(i):
+        session = Session()
+        try:
+            return session.query(Row).filter(Row.id == i % ROWS).first()
+        finally:
+            session.close()
+
+    return write, read
+
+
+def run(engine, operations):
+    """
+    :param engine: The engine to benchmark
+    :param operations: Number of writes, and of reads
+    :return: A tuple of (writes/s, reads/s, connections opened)
+    """
+    connections = []
+    event.listen(engine, 'connect', lambda *args: connections.append(1))
+    write, read = prepare(engine)
+    write = runs_in_db_thread(write)
+    read = runs_in_db_thread(read)
+
+    async def timed(func):
+        started = time.perf_counter()
+        for i in range(operations):
+            await func(i)
+        return operations / (time.perf_counter() - started)
+
+    connections.clear()
+    writes = asyncio.run(timed(write))
+    reads = asyncio.run(timed(read))
+    return writes, reads, len(connections)
+
+
+def contend(engine, seconds):
+    """
+    Runs one writer thread and READERS reader threads against the same file.
+
+    :param engine: The engine to benchmark, prepared by prepare()
+    :param seconds: How long the threads run
+    :return: A Counter of writes, reads, write/read lock errors and the slowest
+    operation in milliseconds
+    """
+    write, read = prepare(engine)
+    counts = Counter()
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def worker(operation, label):
+        i = 0
+        while not stop.is_set():
+            i += 1
+            started = time.perf_counter()
+            try:
+                operation(i)
+                outcome = label
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                outcome = f'{label} lock errors'
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                counts[outcome] += 1
+                counts['slowest ms'] = max(counts['slowest ms'], elapsed)
+
+    threads = [threading.Thread(target=worker, args=(write, 'writes'))]
+    threads += [threading.Thread(target=worker, args=(read, 'reads'))
+                for _ in range(READERS)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def engines(workdir, mode):
+    return {
+        'create_engine (rollback journal, FULL, NullPool)':
+            create_engine(f'sqlite:///{os.path.join(workdir, f"default-{mode}.db")}'),
+        'get_engine (WAL, NORMAL, one kept connection)':
+            get_engine(os.path.join(workdir, f'tuned-{mode}.db')),
+    }
+
+
+def main(operations=2000, seconds=3):
+    workdir = tempfile.mkdtemp()
+    print(f'Sequential: {operations:,} committed writes and {operations:,} reads, one '
+          f'Session each, on the database thread\n')
+    for label, engine in engines(workdir, 'sequential').items():
+        writes, reads, connections = run(engine, operations)
+        print(f'{label:<50}{writes:8,.0f} writes/s {reads:8,.0f} reads/s '
+              f'{connections:6,} connections opened')
+    print(f'\nConcurrent: 1 writer and {READERS} reader threads on the same file for '
+          f'{seconds}s\n')
+    for label, engine in engines(workdir, 'concurrent').items():
+        counts = contend(engine, seconds)
+        print(f'{label:<50}{counts["writes"] / seconds:8,.0f} writes/s '
+              f'{counts["reads"] / seconds:8,.0f} reads/s '
+              f'{counts["writes lock errors"]:4} write / '
+              f'{counts["reads lock errors"]:4} read lock errors, '
+              f'slowest {counts["slowest ms"]:,.0f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,148 @@
+"""
+File: bench_indexes.py
+
+Times the guild, key and weekly run queries against a seeded database with and without
+the composite indexes on Warcraft Characters and Warcraft Character Weekly Runs, and
+prints the query plan SQLite picks for each.
+
+The database is created in a temporary directory, so the bot's database is never
+touched. Run it from the repository root:
+
+    python benchmarks/bench_indexes.py [characters] [runs]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import func, select, text
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEXES = ('ix_characters_guild_rank', 'ix_characters_guild_key_level',
+           'ix_weekly_runs_character_name')
+CALLS = 20
+
+
+def seed(engine, characters_table, runs_table, characters, runs):
+    guilds = max(1, characters // 100)
+    rows = [{'name': f'character{i}', 'realm': f'realm{i % 50}', 'region': 'us',
+             'guild': f'guild{i % guilds}', 'guild_rank': i % 10, 'char_class': 'mage',
+             'ilvl': 400, 'm_plus_key': 'Halls of Atonement' if i % 3 == 0 else None,
+             'm_plus_key_level': random.randint(2, 25) if i % 3 == 0 else None,
+             'm_plus_score_overall': random.randint(0, 3000), 'm_plus_rank_overall': i,
+             'm_plus_rank_class': i, 'm_plus_weekly_high': 15,
+             'm_plus_prev_weekly_high': 15, 'covenant': '', 'renown': ''}
+            for i in range(characters)]
+    with engine.begin() as connection:
+        connection.execute(characters_table.insert(), rows)
+        connection.execute(runs_table.insert(), [
+            {'run_id': str(i), 'character_name': f'character{i % characters}',
+             'dungeon_name': 'Halls of Atonement', 'dungeon_level': random.randint(2, 25)}
+            for i in range(runs)])
+    # The guild whose members all share a realm, about a hundred of them
+    return 'guild0', 'realm0', 'us'
+
+
+def plans(engine, queries):
+    """
+    :param engine: The benchmark engine
+    :param queries: A dict of label: Core select
+    :return: A dict of label: the query plan details joined by ' / '
+    """
+    out = {}
+    with engine.connect() as connection:
+        for label, stmt in queries.items():
+            compiled = stmt.compile(engine, compile_kwargs={'literal_binds': True})
+            out[label] = ' / '.join(
+                row[-1] for row in connection.execute(
+                    text(f'EXPLAIN QUERY PLAN {compiled}')))
+    return out
+
+
+async def time_calls(calls):
+    """
+    :param calls: A dict of label: zero-argument coroutine function
+    :return: A dict of label: mean milliseconds over CALLS calls
+    """
+    means = {}
+    for label, call in calls.items():
+        await call()  # warm the page cache
+        started = time.perf_counter()
+        for _ in range(CALLS):
+            await call()
+        means[label] = (time.perf_counter() - started) / CALLS * 1000
+    return means
+
+
+def main(characters=100000, runs=1000000):
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'cogs', 'warcraft', 'database'))
+    os.chdir(workdir)  # the interfaces open cogs/warcraft/database/database.db
+
+    from cogs.warcraft.database.db_engine_session_init import engine
+    from cogs.warcraft.database.db_models import WarcraftCharacter, WarcraftCharacterWeeklyRun
+    from cogs.warcraft.db_interfaces.warcraft_character_iface import WarcraftCharacterInterface
+    from cogs.warcraft.db_interfaces.weekly_gulld_runs_iface import WarcraftCharacterWeeklyRunsInterface
+
+    characters_table = WarcraftCharacter.__table__
+    runs_table = WarcraftCharacterWeeklyRun.__table__
+    print(f'Seeding {characters:,} characters and {runs:,} weekly runs in {workdir}')
+    guild, realm, region = seed(engine, characters_table, runs_table, characters, runs)
+    names = [f'character{i}' for i in range(0, characters, max(1, characters // 100))]
+
+    calls = {
+        'get_guild_members': lambda: WarcraftCharacterInterface.get_guild_members(
+            guild, realm, region),
+        'get_guild_members(ranks)': lambda: WarcraftCharacterInterface.get_guild_members(
+            guild, realm, region, ranks=[0, 1]),
+        'get_guild_keys': lambda: WarcraftCharacterInterface.get_guild_keys(
+            guild, realm, region),
+        'get_player_runs': lambda: WarcraftCharacterWeeklyRunsInterface.get_player_runs(
+            'character7'),
+        f'get_run_counts({len(names)} names)':
+            lambda: WarcraftCharacterWeeklyRunsInterface.get_run_counts(names),
+        'get_guilds': WarcraftCharacterInterface.get_guilds,
+    }
+    member_filter = ((characters_table.c.guild == guild) &
+                     (characters_table.c.realm == realm) &
+                     (characters_table.c.region == region))
+    queries = {
+        'get_guild_members': characters_table.select().where(member_filter),
+        'get_guild_members(ranks)': characters_table.select().where(
+            member_filter & characters_table.c.guild_rank.in_([0, 1])),
+        'get_guild_keys': characters_table.select().where(
+            member_filter & (characters_table.c.m_plus_key_level > 1)).order_by(
+            characters_table.c.m_plus_key_level.desc(), characters_table.c.name),
+        'get_player_runs': runs_table.select().where(
+            runs_table.c.character_name == 'character7'),
+        f'get_run_counts({len(names)} names)': select(
+            [runs_table.c.character_name, func.count(runs_table.c.id)]).where(
+            runs_table.c.character_name.in_(names)).group_by(
+            runs_table.c.character_name),
+        'get_guilds': select([characters_table.c.guild, characters_table.c.realm,
+                              characters_table.c.region]).distinct(),
+    }
+
+    with_indexes = asyncio.run(time_calls(calls))
+    with_plans = plans(engine, queries)
+    with engine.begin() as connection:
+        for index in INDEXES:
+            connection.execute(text(f'DROP INDEX "{index}"'))
+    engine.dispose()  # pooled connections keep statements prepared against the indexes
+    without_indexes = asyncio.run(time_calls(calls))
+    without_plans = plans(engine, queries)
+
+    print(f'\nMean of {CALLS} calls, without -> with the indexes:\n')
+    for label in calls:
+        print(f'{label:<28}{without_indexes[label]:8.1f} -> '
+              f'{with_indexes[label]:6.1f} ms')
+        print(f'    without: {without_plans[label]}')
+        print(f'    with:    {with_plans[label]}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,98 @@
+"""
+File: bench_rows.py
+
+Compares a full read of the Warcraft Characters table through the ORM, as
+get_all_characters did before, with the Core select into CharacterRow tuples it runs
+now, at 10k and 100k rows. Time is the best of a few reads with perf_counter, memory
+is measured in a separate read with tracemalloc: what the returned rows keep alive
+and the peak while reading them.
+
+The database is created in a temporary directory, so the bot's database is never
+touched. Run it from the repository root:
+
+    python benchmarks/bench_rows.py [rows ...]
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPEATS = 3
+
+
+def seed(engine, table, start, stop):
+    with engine.begin() as connection:
+        connection.execute(table.insert(), [
+            {'name': f'character{i}', 'realm': 'wyrmrest-accord', 'region': 'us',
+             'guild': f'guild{i % 100}', 'guild_rank': i % 10, 'char_class': 'mage',
+             'ilvl': 400, 'm_plus_key': None, 'm_plus_key_level': None,
+             'm_plus_score_overall': i % 3000, 'm_plus_rank_overall': i,
+             'm_plus_rank_class': i, 'm_plus_weekly_high': 15,
+             'm_plus_prev_weekly_high': 15, 'covenant': 'Kyrian', 'renown': '40'}
+            for i in range(start, stop)])
+
+
+def measure(read):
+    """
+    :param read: Zero-argument function returning the rows
+    :return: A tuple of (best milliseconds, MiB retained by the rows, peak MiB)
+    """
+    best = float('inf')
+    for _ in range(REPEATS):
+        gc.collect()
+        started = time.perf_counter()
+        rows = read()
+        best = min(best, time.perf_counter() - started)
+        del rows
+    gc.collect()
+    tracemalloc.start()
+    rows = read()
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    return best * 1000, retained / 2 ** 20, peak / 2 ** 20
+
+
+def main(*sizes):
+    sizes = sorted(sizes or (10000, 100000))
+    sys.path.insert(0, ROOT)
+    workdir = tempfile.mkdtemp()
+    os.makedirs(os.path.join(workdir, 'cogs', 'warcraft', 'database'))
+    os.chdir(workdir)  # the interfaces open cogs/warcraft/database/database.db
+
+    from cogs.warcraft.database.db_engine_session_init import engine, Session
+    from cogs.warcraft.database.db_models import WarcraftCharacter
+    from cogs.warcraft.db_interfaces.warcraft_character_iface import WarcraftCharacterInterface
+
+    table = WarcraftCharacter.__table__
+
+    def orm_read():
+        session = Session()
+        try:
+            return session.query(WarcraftCharacter).all()
+        finally:
+            session.close()
+
+    def core_read():
+        return WarcraftCharacterInterface._select_rows(table.select())
+
+    print(f'Full read of the characters table in {workdir}, best of {REPEATS}:\n')
+    print(f'{"rows":>8}  {"path":<5}{"time":>10}{"retained":>12}{"peak":>12}')
+    seeded = 0
+    for size in sizes:
+        seed(engine, table, seeded, size)
+        seeded = size
+        for label, read in (('ORM', orm_read), ('Core', core_read)):
+            assert len(read()) == size
+            elapsed, retained, peak = measure(read)
+            print(f'{size:>8,}  {label:<5}{elapsed:>7.0f} ms{retained:>8.1f} MiB'
+                  f'{peak:>8.1f} MiB')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
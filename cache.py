@@ -0,0 +1,69 @@
+"""
+File: cache.py
+
+This file contains a small in-memory cache with a size bound (least recently used
+entries are evicted first) and a per-entry time to live. Used for API data that rarely
+changes, such as Twitch game names and user profiles.
+"""
+
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    def __init__(self, maxsize=1000, ttl=3600):
+        """
+        :param maxsize: Max number of entries kept
+        :param ttl: Seconds an entry stays valid after it was stored
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key: (expires_at, value)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for key, counting the lookup as a hit or a miss.
+
+        :param key: The cache key
+        :param default: Returned when the key is missing or expired
+        :return: The cached value if present, otherwise default
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """
+        :return: A dict with the entry count, hits, misses and hit rate
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
@@ -1,10 +1,10 @@
 from pathlib import Path
 
-import aiohttp
 import discord
 
 from config import DiscordAPI
 from discord.ext import commands
+from http_client import HttpClient
 
 
 bot_prefix = commands.when_mentioned_or('Casper ', 'casper ')
@@ -21,15 +21,15 @@ class CasperBot(commands.Bot):
                          owner_id=DiscordAPI.OWNERID,
                          *args, **kwargs)
 
-        self.aiohttp_connector = aiohttp.TCPConnector(
-            limit=2,
-            force_close=True,
-            enable_cleanup_closed=True
-        )
-        self.aiohttp_session = aiohttp.ClientSession(connector=self.aiohttp_connector)
+        self.http_client = HttpClient(limit=100, limit_per_host=10)
+        self.aiohttp_session = self.http_client.session
 
         self.temp_shut_down = False
 
+    async def close(self):
+        await self.http_client.close()
+        await super().close()
+
     @staticmethod
     async def on_ready():
         print('=============================================================\n'
@@ -90,6 +90,19 @@ async def where(ctx):
         return await ctx.send(output)
 
 
+@casper_bot.command(hidden=True)
+async def httpstats(ctx):
+    if ctx.author.id == casper_bot.owner_id:
+        connector = casper_bot.http_client.connector
+        output = (f'```Pool limit {connector.limit}, {connector.limit_per_host} per host\n'
+                  f'Host                     Requests  New  Reused  Queued  Active  Peak\n')
+        for host, stats in casper_bot.http_client.metrics().items():
+            output += (f'{str(host):<25}{stats["requests"]:<10}{stats["created"]:<5}'
+                       f'{stats["reused"]:<8}{stats["queued"]:<8}{stats["in_flight"]:<8}'
+                       f'{stats["peak"]}\n')
+        return await ctx.send(output + '```')
+
+
 @casper_bot.command(hidden=True)
 async def thanks(ctx):
     return await ctx.send('You\'re welcome.')
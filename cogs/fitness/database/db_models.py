@@ -8,7 +8,7 @@ needing access to one or more of the defined table ORM objects below.
 from sqlalchemy import Column, String, Boolean, Integer, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 
-from cogs.twitch.database.db_engine_session_init import engine
+from cogs.fitness.database.db_engine_session_init import engine
 
 Base = declarative_base()
 
@@ -1,10 +1,12 @@
 from cogs.fitness.database.db_models import FitnessUser
 from cogs.fitness.database.db_engine_session_init import Session
+from storage import runs_in_db_thread
 
 
 class FitnessUserInterface:
     @classmethod
-    async def get_user(cls, user, guild_id: int):
+    @runs_in_db_thread
+    def get_user(cls, user, guild_id: int):
         """
         Checks to see if a user exists already. If not, it creates a new record. Returns
         user record.
@@ -12,6 +14,10 @@ class FitnessUserInterface:
         :param guild_id: the id of the discord server the user belongs to
         :return: the user record
         """
+        return cls._get_user(user, guild_id)
+
+    @classmethod
+    def _get_user(cls, user, guild_id: int):
         session = Session()
         fitness = session.query(FitnessUser).filter_by(user=user.lower(),
                                                        guild_id=guild_id).first()
@@ -25,117 +31,130 @@ class FitnessUserInterface:
         return fitness
 
     @classmethod
-    async def setgender(cls, user, guild_id: int, gender: str):
+    @runs_in_db_thread
+    def setgender(cls, user, guild_id: int, gender: str):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.gender = gender.lower()
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setheight(cls, user, guild_id: int, height: float):
+    @runs_in_db_thread
+    def setheight(cls, user, guild_id: int, height: float):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.height = height
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setweight(cls, user, guild_id: int, weight: float):
+    @runs_in_db_thread
+    def setweight(cls, user, guild_id: int, weight: float):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.weight = weight
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setgoalweight(cls, user, guild_id: int, weight: float):
+    @runs_in_db_thread
+    def setgoalweight(cls, user, guild_id: int, weight: float):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.goal_weight = weight
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setbench(cls, user, guild_id: int, weight: float):
+    @runs_in_db_thread
+    def setbench(cls, user, guild_id: int, weight: float):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.bench_press = weight
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setsquat(cls, user, guild_id: int, weight: float):
+    @runs_in_db_thread
+    def setsquat(cls, user, guild_id: int, weight: float):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.back_squat = weight
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setdeadlift(cls, user, guild_id: int, weight: float):
+    @runs_in_db_thread
+    def setdeadlift(cls, user, guild_id: int, weight: float):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.deadlift = weight
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setohp(cls, user, guild_id: int, weight: float):
+    @runs_in_db_thread
+    def setohp(cls, user, guild_id: int, weight: float):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.ohp = weight
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setmile(cls, user, guild_id: int, time: str):
+    @runs_in_db_thread
+    def setmile(cls, user, guild_id: int, time: str):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.mile = time
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setrowing(cls, user, guild_id: int, time: str):
+    @runs_in_db_thread
+    def setrowing(cls, user, guild_id: int, time: str):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.row_2km = time
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setburpees(cls, user, guild_id: int, count: int):
+    @runs_in_db_thread
+    def setburpees(cls, user, guild_id: int, count: int):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.burpess_1m = count
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def setplank(cls, user, guild_id: int, time: str):
+    @runs_in_db_thread
+    def setplank(cls, user, guild_id: int, time: str):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         fitness.plank = time
         session.add(fitness)
         session.commit()
         session.close()
 
     @classmethod
-    async def get_progress(cls, user, guild_id: int):
+    @runs_in_db_thread
+    def get_progress(cls, user, guild_id: int):
         session = Session()
-        fitness = await cls.get_user(user.lower(), guild_id)
+        fitness = cls._get_user(user.lower(), guild_id)
         session.add(fitness)
         session.commit()
         return fitness
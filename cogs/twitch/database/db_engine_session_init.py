@@ -6,9 +6,9 @@ db_models.py file for engine use to create the necessary tables and by any file
 access to the Session object for database transactions.
 """
 
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
-engine = create_engine('sqlite:///cogs/twitch/database/database.db',
-                       echo=False)
+from storage import get_engine
+
+engine = get_engine('cogs/twitch/database/database.db')
 Session = sessionmaker(bind=engine)
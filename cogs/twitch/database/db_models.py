@@ -15,8 +15,15 @@ Base = declarative_base()
 
 class TwitchStream(Base):
     __tablename__ = 'Twitch Streams'
-    twitch_name = Column(String, primary_key=True)
+    username = Column('twitch_name', String, primary_key=True)
     is_live = Column(Boolean)
 
 
+class TwitchSubscription(Base):
+    __tablename__ = 'Twitch Subscriptions'
+    username = Column(String, primary_key=True)
+    guild_id = Column(Integer, primary_key=True)
+    channel_id = Column(Integer)
+
+
 Base.metadata.create_all(engine)
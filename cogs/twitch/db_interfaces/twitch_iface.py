@@ -1,15 +1,25 @@
-from sqlalchemy import desc, asc
-from typing import List
+from collections import defaultdict
+from sqlalchemy import desc, asc, case, func, update
+from typing import Dict, List, Tuple
 
-from cogs.twitch.database.db_models import TwitchStream
+from cogs.twitch.database.db_models import TwitchStream, TwitchSubscription
 from cogs.twitch.database.db_engine_session_init import Session
+from storage import runs_in_db_thread
 
 
 class TwitchDBInterface:
+    # Twitch logins are case-insensitive and the API reports them in lower case.
+    # Usernames are stored lower case and compared with lower() on lookup, so rows
+    # stored as typed before that still match.
+    @staticmethod
+    def _username_is(column, username):
+        return func.lower(column) == username.lower()
+
     @classmethod
-    async def add_channel(cls, **kwargs) -> bool:
+    @runs_in_db_thread
+    def add_channel(cls, **kwargs) -> bool:
         channel = TwitchStream(
-            username=kwargs.get('username'),
+            username=kwargs.get('username').lower(),
             is_live=kwargs.get('is_live', False)
         )
         success = False
@@ -28,9 +38,11 @@ class TwitchDBInterface:
             return success
 
     @classmethod
-    async def remove_channel(cls, username):
+    @runs_in_db_thread
+    def remove_channel(cls, username):
         session = Session()
-        channel = session.query(TwitchStream).filter_by(username=username).first()
+        channel = session.query(TwitchStream).filter(
+            cls._username_is(TwitchStream.username, username)).first()
         if channel is not None:
             success = False
             try:
@@ -47,17 +59,19 @@ class TwitchDBInterface:
                 return success
 
     @classmethod
-    async def get_all_channels(cls) -> List['TwitchStream']:
+    @runs_in_db_thread
+    def get_all_channels(cls) -> List['TwitchStream']:
         session = Session()
         channels = session.query(TwitchStream).all()
         session.close()
         return channels
 
     @classmethod
-    async def set_is_live(cls, username: str, is_live: bool) -> bool:
+    @runs_in_db_thread
+    def set_is_live(cls, username: str, is_live: bool) -> bool:
         session = Session()
-        channel = session.query(TwitchStream).filter_by(
-            username=username.lower()).first()
+        channel = session.query(TwitchStream).filter(
+            cls._username_is(TwitchStream.username, username)).first()
         channel.is_live = is_live
         success = False
         try:
@@ -71,3 +85,137 @@ class TwitchDBInterface:
         finally:
             session.close()
             return success
+
+    @classmethod
+    @runs_in_db_thread
+    def get_live_states(cls) -> Dict[str, bool]:
+        """
+        Loads the stored live state of every registered channel.
+
+        :return: A dict of username: is_live
+        """
+        session = Session()
+        states = {username.lower(): bool(is_live) for username, is_live in
+                  session.query(TwitchStream.username, TwitchStream.is_live)}
+        session.close()
+        return states
+
+    @classmethod
+    @runs_in_db_thread
+    def set_live_states(cls, changes: Dict[str, bool]) -> bool:
+        """
+        Writes a set of live state transitions with a single UPDATE statement.
+
+        :param changes: A dict of username: is_live for channels whose state changed
+        :return: True if the transitions were committed, otherwise False
+        """
+        if len(changes) == 0:
+            return True
+        changes = {username.lower(): is_live for username, is_live in changes.items()}
+        username = func.lower(TwitchStream.username)
+        session = Session()
+        success = False
+        try:
+            session.execute(
+                update(TwitchStream)
+                .where(username.in_(list(changes)))
+                .values(is_live=case(changes, value=username))
+                .execution_options(synchronize_session=False)
+            )
+            session.commit()
+            success = True
+        except Exception as e:
+            session.rollback()
+            print(f'An error occurred when updating stream status for '
+                  f'{", ".join(changes)}:\n'
+                  f'ERROR: {e}')
+        finally:
+            session.close()
+            return success
+
+    @classmethod
+    @runs_in_db_thread
+    def add_subscription(cls, username: str, guild_id: int, channel_id: int) -> bool:
+        """
+        Subscribes a discord channel to a streamer. The streamer is registered for
+        polling if this is their first subscription. A guild has at most one
+        announcement channel per streamer; subscribing again moves it.
+
+        :param username: The Twitch login
+        :param guild_id: The discord server subscribing
+        :param channel_id: The discord channel announcements are sent to
+        :return: True if the subscription was stored, otherwise False
+        """
+        username = username.lower()
+        session = Session()
+        success = False
+        try:
+            if session.query(TwitchStream).filter(
+                    cls._username_is(TwitchStream.username, username)).first() is None:
+                session.add(TwitchStream(username=username, is_live=False))
+            session.query(TwitchSubscription).filter(  # stored as typed, see above
+                cls._username_is(TwitchSubscription.username, username),
+                TwitchSubscription.username != username,
+                TwitchSubscription.guild_id == guild_id).delete(synchronize_session=False)
+            session.merge(TwitchSubscription(
+                username=username, guild_id=guild_id, channel_id=channel_id))
+            session.commit()
+            success = True
+        except Exception as e:
+            session.rollback()
+            print(f'An error occurred while subscribing to the Twitch channel for:\n'
+                  f'{username}\n'
+                  f'ERROR: {e}')
+        finally:
+            session.close()
+            return success
+
+    @classmethod
+    @runs_in_db_thread
+    def remove_subscription(cls, username: str, guild_id: int) -> bool:
+        """
+        Unsubscribes a discord server from a streamer. The streamer stops being polled
+        once nobody is subscribed to them.
+
+        :param username: The Twitch login
+        :param guild_id: The discord server unsubscribing
+        :return: True if the subscription was removed, otherwise False
+        """
+        session = Session()
+        success = False
+        try:
+            session.query(TwitchSubscription).filter(
+                cls._username_is(TwitchSubscription.username, username),
+                TwitchSubscription.guild_id == guild_id).delete(synchronize_session=False)
+            if session.query(TwitchSubscription).filter(
+                    cls._username_is(TwitchSubscription.username, username)).count() == 0:
+                session.query(TwitchStream).filter(
+                    cls._username_is(TwitchStream.username, username)
+                ).delete(synchronize_session=False)
+            session.commit()
+            success = True
+        except Exception as e:
+            session.rollback()
+            print(f'An error occurred while unsubscribing from the Twitch channel for:\n'
+                  f'{username}\n'
+                  f'ERROR: {e}')
+        finally:
+            session.close()
+            return success
+
+    @classmethod
+    @runs_in_db_thread
+    def get_subscriptions(cls) -> Dict[str, List[Tuple[int, int]]]:
+        """
+        Builds the streamer to announcement channel index.
+
+        :return: A dict of username: list of (guild_id, channel_id)
+        """
+        session = Session()
+        subscriptions = defaultdict(list)
+        for username, guild_id, channel_id in session.query(
+                TwitchSubscription.username, TwitchSubscription.guild_id,
+                TwitchSubscription.channel_id):
+            subscriptions[username.lower()].append((guild_id, channel_id))
+        session.close()
+        return subscriptions
@@ -0,0 +1,137 @@
+"""
+File: eventsub.py
+
+This file contains a small aiohttp web server that receives Twitch EventSub webhook
+callbacks. Every message is checked against its HMAC-SHA256 signature before it is
+acted on, and stream.online/stream.offline notifications are handed to the callbacks
+given by the Twitch cog. The server has no dependency on discord, so it can be run and
+exercised on its own with a local sender signing requests via `sign_message`.
+"""
+
+import hashlib
+import hmac
+import json
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+from cache import TTLCache
+
+MESSAGE_ID = 'Twitch-Eventsub-Message-Id'
+MESSAGE_TIMESTAMP = 'Twitch-Eventsub-Message-Timestamp'
+MESSAGE_SIGNATURE = 'Twitch-Eventsub-Message-Signature'
+MESSAGE_TYPE = 'Twitch-Eventsub-Message-Type'
+
+
+def sign_message(secret, message_id, timestamp, body):
+    """
+    Computes the signature Twitch sends in the Twitch-Eventsub-Message-Signature header.
+
+    :param secret: The secret given when the subscription was created
+    :param message_id: The Twitch-Eventsub-Message-Id header
+    :param timestamp: The Twitch-Eventsub-Message-Timestamp header
+    :param body: The raw request body as bytes
+    :return: The signature formatted as sha256=<hex digest>
+    """
+    message = message_id.encode() + timestamp.encode() + body
+    return 'sha256=' + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class EventSubReceiver:
+    def __init__(self, secret, on_online, on_offline, host='0.0.0.0', port=8080,
+                 path='/twitch/eventsub', max_message_age=600):
+        """
+        :param secret: The secret used when creating the EventSub subscriptions
+        :param on_online: Coroutine function called with the stream.online event
+        :param on_offline: Coroutine function called with the stream.offline event
+        :param host: Interface the web server binds to
+        :param port: Port the web server listens on
+        :param path: Path of the callback url
+        :param max_message_age: Seconds after which a message is rejected as a replay
+        """
+        self.secret = secret
+        self.on_online = on_online
+        self.on_offline = on_offline
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_message_age = max_message_age
+        self.seen_message_ids = TTLCache(maxsize=10000, ttl=max_message_age)
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle)
+        self._runner = None
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f'EventSub receiver listening on {self.host}:{self.port}{self.path}')
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def verify(self, headers, body):
+        """
+        Checks the message signature and rejects stale messages.
+
+        :param headers: The request headers
+        :param body: The raw request body as bytes
+        :return: True if the message came from Twitch, otherwise False
+        """
+        try:
+            message_id = headers[MESSAGE_ID]
+            timestamp = headers[MESSAGE_TIMESTAMP]
+            signature = headers[MESSAGE_SIGNATURE]
+        except KeyError:
+            return False
+        expected = sign_message(self.secret, message_id, timestamp, body)
+        if not hmac.compare_digest(expected, signature):
+            return False
+        try:
+            # Twitch sends nanosecond precision, which fromisoformat cannot parse
+            sent_at = datetime.strptime(timestamp[:19], '%Y-%m-%dT%H:%M:%S').replace(
+                tzinfo=timezone.utc)
+        except ValueError:
+            return False
+        age = datetime.now(timezone.utc) - sent_at
+        return age < timedelta(seconds=self.max_message_age)
+
+    async def handle(self, request):
+        body = await request.read()
+        if not self.verify(request.headers, body):
+            return web.Response(status=403)
+        message_id = request.headers[MESSAGE_ID]
+        if message_id in self.seen_message_ids:  # Twitch retries until it gets a 2xx
+            return web.Response(status=204)
+        message_type = request.headers.get(MESSAGE_TYPE)
+        try:
+            payload = json.loads(body)
+            if message_type == 'webhook_callback_verification':
+                response = web.Response(text=str(payload['challenge']),
+                                        content_type='text/plain')
+            elif message_type == 'revocation':
+                print(f'EventSub subscription revoked:\n{payload["subscription"]}')
+                response = web.Response(status=204)
+            elif message_type == 'notification':
+                subscription_type = payload['subscription']['type']
+                event = payload['event']
+                response = web.Response(status=204)
+            else:
+                response = web.Response(status=204)
+        except (ValueError, KeyError, TypeError) as e:
+            print(f'Malformed EventSub {message_type} message {message_id}:\n{e}')
+            return web.Response(status=400)
+        if message_type == 'notification':
+            try:
+                if subscription_type == 'stream.online':
+                    await self.on_online(event)
+                elif subscription_type == 'stream.offline':
+                    await self.on_offline(event)
+            except Exception as e:
+                # Not recorded as seen, so the retry Twitch sends is handled again
+                print(f'Error handling EventSub {subscription_type} notification:\n{e}')
+                return web.Response(status=500)
+        self.seen_message_ids.set(message_id, True)
+        return response
@@ -5,10 +5,14 @@ import aiohttp
 import discord
 
 from cogs.twitch.db_interfaces.twitch_iface import TwitchDBInterface as TwitchIface
+from cache import TTLCache
+from cogs.twitch.eventsub import EventSubReceiver
+from cogs.twitch.twitch_token import TwitchTokenManager
 from config import TwitchAPI
 from configparser import ConfigParser
 from datetime import datetime
 from discord.ext import commands, tasks
+from rate_limits import BACKGROUND, host_rate_limiter
 from utilities import Utilities as Utils
 
 
@@ -20,6 +24,14 @@ class Twitch(commands.Cog):
         self.config.read('config.ini')
 
         self.aiohttp_session = casper.aiohttp_session
+        self.token_manager = TwitchTokenManager(self.aiohttp_session, self.config)
+        self.streams_batch_size = 100  # max user_login values per Helix /streams call
+        self.live_states = None  # username: is_live, loaded on the first poll
+        self.subscriptions = None  # username: [(guild_id, channel_id)]
+        self.game_cache = TTLCache(maxsize=500, ttl=24 * 60 * 60)
+        self.user_cache = TTLCache(maxsize=2000, ttl=6 * 60 * 60)
+        # Streamers registered before subscriptions existed announce here
+        self.default_announce_channel_id = 307655779056484353
 
         @tasks.loop(seconds=60)
         async def check_for_streams():
@@ -28,35 +40,45 @@ class Twitch(commands.Cog):
 
             :return: None
             """
-            ch_sims_and_logs = self.casper.get_channel(307655779056484353)
             print(f'=============================================\n'
                   f'Crawling streams at {datetime.now()}...')
-            channels = await TwitchIface.get_all_channels()
             try:
-                for ch in channels:
-                    print(f'Checking {ch.username.title()} stream...')
-                    stream = await self.get_twitch_channel_status(ch.username)
-                    stream = stream['data']
-                    if len(stream) == 0:  # non-live streams are empty
-                        await TwitchIface.set_is_live(ch.username, False)
-                        continue
-                    print(f'{ch.username} is live:')
-                    pprint(stream)
-                    if ch.is_live is False:
-                        if await TwitchIface.set_is_live(ch.username, True):
-                            game_name = await self.get_twitch_game_name(stream[0]['game_id'])
-                            embed = await self.create_new_live_stream_embed(
-                                stream[0], game_name)
-                            await ch_sims_and_logs.send(embed=embed)
+                await self.load_stream_state()
+                # Each streamer is polled once no matter how many servers follow them
+                streams = await self.get_twitch_streams(list(self.live_states))
+                await self.reconcile_streams(streams)
             except Exception as e:
                 print(f'Weird error?\n{e}')
                 pass
             print(f'Finished crawling streams.\n'
                   f'=============================================')
 
+        # With EventSub enabled, Twitch pushes live/offline changes to us and polling
+        # only runs occasionally to catch anything missed while the bot was down.
+        self.eventsub_receiver = None
+        if getattr(TwitchAPI, 'EVENTSUB_SECRET', None) and \
+                getattr(TwitchAPI, 'EVENTSUB_CALLBACK_URL', None):
+            self.eventsub_receiver = EventSubReceiver(
+                TwitchAPI.EVENTSUB_SECRET, self.on_stream_online, self.on_stream_offline,
+                port=getattr(TwitchAPI, 'EVENTSUB_PORT', 8080))
+            check_for_streams.change_interval(minutes=15)
+            asyncio.ensure_future(self.start_eventsub())
+
         check_for_streams.start()
 
+    def cog_unload(self):
+        if self.eventsub_receiver is not None:
+            asyncio.ensure_future(self.eventsub_receiver.stop())
+
+    async def cog_command_error(self, ctx, error):
+        if isinstance(error, commands.NoPrivateMessage):
+            await ctx.send('Twitch notifications are set up per server, please use this '
+                           'command in the channel that should receive them.')
+        else:
+            print(f'Error in command {ctx.command}:\n{error}')
+
     @commands.command()
+    @commands.guild_only()
     async def addtwitch(self, ctx, username: str) -> discord.Message:
         """
         Add a new twitch channel to be polled for when they go live
@@ -68,13 +90,24 @@ class Twitch(commands.Cog):
         if username is None:
             return await ctx.send('Please include the username of the Twitch channel '
                                   'you\'d you like remove.')
-        if await TwitchIface.add_channel(username=username.lower()):
-            return await ctx.send(f'Record created for {username.title()}.')
+        username = username.lower()
+        await self.load_stream_state()
+        if await TwitchIface.add_subscription(username, ctx.guild.id, ctx.channel.id):
+            if username not in self.live_states and self.eventsub_receiver is not None:
+                await self.create_eventsub_subscriptions([username])
+            self.live_states.setdefault(username, False)
+            self.subscriptions[username] = [
+                (guild_id, channel_id) for guild_id, channel_id
+                in self.subscriptions.get(username, []) if guild_id != ctx.guild.id
+            ] + [(ctx.guild.id, ctx.channel.id)]
+            return await ctx.send(f'Record created for {username.title()}. Live '
+                                  f'notifications will be sent to this channel.')
         else:
             return await ctx.send('An error occurred when creating a record for your '
                                   'channel.')
 
     @commands.command()
+    @commands.guild_only()
     async def removetwitch(self, ctx, username: str = None) -> discord.Message:
         """
         Remove a twitch channel from going live notifications.
@@ -86,125 +119,401 @@ class Twitch(commands.Cog):
         if username is None:
             return await ctx.send('Please include the username of the Twitch channel '
                                   'you\'d you like remove.')
-        if await TwitchIface.remove_channel(username.lower()):
+        username = username.lower()
+        await self.load_stream_state()
+        if await TwitchIface.remove_subscription(username, ctx.guild.id):
+            self.subscriptions[username] = [
+                (guild_id, channel_id) for guild_id, channel_id
+                in self.subscriptions.get(username, []) if guild_id != ctx.guild.id
+            ]
+            if len(self.subscriptions[username]) == 0:
+                del self.subscriptions[username]
+                self.live_states.pop(username, None)
+                if self.eventsub_receiver is not None:
+                    await self.delete_eventsub_subscriptions([username])
             return await ctx.send(f'Record removed for {username.title()}.')
         else:
             return await ctx.send('An error occurred when creating a record for your '
                                   'channel.')
 
+    @commands.command(hidden=True)
+    async def twitchcache(self, ctx):
+        if ctx.author.id != self.casper.owner_id:
+            return
+        output = '```Cache   Size  Hits  Misses  Hit rate\n'
+        for name, cache in (('games', self.game_cache), ('users', self.user_cache)):
+            stats = cache.stats()
+            output += (f'{name:<8}{stats["size"]:<6}{stats["hits"]:<6}'
+                       f'{stats["misses"]:<8}{stats["hit_rate"]:.0%}\n')
+        return await ctx.send(output + '```')
+
     # region Cog Logic
+    async def load_stream_state(self):
+        """
+        Loads the live state map and the subscription index the first time they are
+        needed. Afterwards both are kept up to date in memory.
+
+        :return: None
+        """
+        if self.live_states is None:
+            self.live_states = await TwitchIface.get_live_states()
+        if self.subscriptions is None:
+            self.subscriptions = await TwitchIface.get_subscriptions()
+
+    async def reconcile_streams(self, streams):
+        """
+        Compares fetched stream statuses against the in-memory live states, writes only
+        the channels whose state flipped, and announces the ones that went live.
+
+        :param streams: A dict of username: stream data, or None if offline
+        :return: None
+        """
+        went_live = {username: stream for username, stream in streams.items()
+                     if stream is not None and not self.live_states.get(username)}
+        went_offline = [username for username, stream in streams.items()
+                        if stream is None and self.live_states.get(username)]
+        changes = {username: True for username in went_live}
+        changes.update({username: False for username in went_offline})
+        if len(changes) == 0:
+            return
+        # Claimed before the write is awaited, so an EventSub notification and the poll
+        # reconciling the same flip concurrently cannot both announce it
+        previous = {username: self.live_states.get(username) for username in changes}
+        self.live_states.update(changes)
+        if not await TwitchIface.set_live_states(changes):
+            for username, is_live in previous.items():
+                if is_live is None:
+                    self.live_states.pop(username, None)
+                else:
+                    self.live_states[username] = is_live
+            return
+        if len(went_live) > 0:
+            # Warm the caches with one request per endpoint for the whole tick
+            game_names, _ = await asyncio.gather(
+                self.get_twitch_game_names(
+                    [stream['game_id'] for stream in went_live.values()]),
+                self.get_twitch_users(list(went_live)))
+            for username, stream in went_live.items():
+                print(f'{username} is live:')
+                pprint(stream)
+                embed = await self.create_new_live_stream_embed(
+                    stream, game_names[stream['game_id']])
+                await self.announce(username, embed)
+
+    async def start_eventsub(self):
+        """
+        Starts the EventSub receiver and subscribes to every registered streamer.
+
+        :return: None
+        """
+        await self.eventsub_receiver.start()
+        await self.load_stream_state()
+        await self.create_eventsub_subscriptions(list(self.live_states))
+
+    async def create_eventsub_subscriptions(self, usernames):
+        """
+        Asks Twitch to push stream.online and stream.offline events for the given
+        streamers to our callback url. Existing subscriptions are answered with a 409
+        by Twitch and are left alone.
+
+        :param usernames: A list of Twitch logins
+        :return: None
+        """
+        access_token = await self.get_twitch_access_token()
+        if not access_token:
+            return
+        headers = {'Client-ID': TwitchAPI.CLIENT_ID,
+                   'Authorization': f'Bearer {access_token}'}
+        url = 'https://api.twitch.tv/helix/eventsub/subscriptions'
+        users = await self.get_twitch_users(usernames)
+        for user_data in users.values():
+            for subscription_type in ('stream.online', 'stream.offline'):
+                body = {'type': subscription_type, 'version': '1',
+                        'condition': {'broadcaster_user_id': user_data['id']},
+                        'transport': {'method': 'webhook',
+                                      'callback': TwitchAPI.EVENTSUB_CALLBACK_URL,
+                                      'secret': TwitchAPI.EVENTSUB_SECRET}}
+                await host_rate_limiter.acquire(url, BACKGROUND)
+                try:
+                    async with self.aiohttp_session.post(
+                            url, headers=headers, json=body) as resp:
+                        if resp.status not in (202, 409):
+                            print(f'EventSub {subscription_type} subscription for '
+                                  f'{user_data["login"]} failed:\n'
+                                  f'{resp.status}:{resp.reason}')
+                except aiohttp.ClientConnectionError as e:
+                    print(f'An error occurred while posting data to {url}:\n{e}')
+
+    async def delete_eventsub_subscriptions(self, usernames):
+        """
+        Deletes the stream.online and stream.offline subscriptions created by
+        create_eventsub_subscriptions for streamers nobody follows anymore.
+
+        :param usernames: A list of Twitch logins
+        :return: None
+        """
+        access_token = await self.get_twitch_access_token()
+        if not access_token:
+            return
+        headers = {'Client-ID': TwitchAPI.CLIENT_ID,
+                   'Authorization': f'Bearer {access_token}'}
+        url = 'https://api.twitch.tv/helix/eventsub/subscriptions'
+        users = await self.get_twitch_users(usernames)
+        for user_data in users.values():
+            await host_rate_limiter.acquire(url, BACKGROUND)
+            try:
+                async with self.aiohttp_session.get(
+                        url, headers=headers,
+                        params={'user_id': user_data['id']}) as resp:
+                    if resp.status != 200:
+                        print(f'Listing EventSub subscriptions for {user_data["login"]} '
+                              f'failed:\n{resp.status}:{resp.reason}')
+                        continue
+                    subscriptions = (await resp.json()).get('data', [])
+            except aiohttp.ClientConnectionError as e:
+                print(f'An error occurred while getting data from {url}:\n{e}')
+                continue
+            for subscription in subscriptions:
+                if subscription['type'] not in ('stream.online', 'stream.offline'):
+                    continue
+                await host_rate_limiter.acquire(url, BACKGROUND)
+                try:
+                    async with self.aiohttp_session.delete(
+                            url, headers=headers,
+                            params={'id': subscription['id']}) as resp:
+                        if resp.status not in (204, 404):
+                            print(f'Deleting EventSub {subscription["type"]} subscription '
+                                  f'for {user_data["login"]} failed:\n'
+                                  f'{resp.status}:{resp.reason}')
+                except aiohttp.ClientConnectionError as e:
+                    print(f'An error occurred while deleting {url}:\n{e}')
+
+    async def on_stream_online(self, event):
+        username = event['broadcaster_user_login'].lower()
+        await self.load_stream_state()
+        if username not in self.live_states:
+            return
+        # The notification has no title/game, /streams usually has them by now
+        streams = await self.get_twitch_streams([username])
+        stream = streams.get(username) or {
+            'user_login': username, 'user_name': event['broadcaster_user_name'],
+            'game_id': '', 'title': ''}
+        await self.reconcile_streams({username: stream})
+
+    async def on_stream_offline(self, event):
+        username = event['broadcaster_user_login'].lower()
+        await self.load_stream_state()
+        if username not in self.live_states:
+            return
+        await self.reconcile_streams({username: None})
+
+    async def announce(self, username, embed):
+        """
+        Sends a live notification to every discord channel subscribed to a streamer,
+        concurrently.
+
+        :param username: The Twitch login that went live
+        :param embed: The live notification embed
+        :return: None
+        """
+        channel_ids = [channel_id for _, channel_id
+                       in self.subscriptions.get(username, [])]
+        if len(channel_ids) == 0:
+            channel_ids = [self.default_announce_channel_id]
+        channels = [self.casper.get_channel(channel_id) for channel_id in channel_ids]
+        results = await asyncio.gather(
+            *[channel.send(embed=embed) for channel in channels if channel is not None],
+            return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f'Could not send live notification for {username}:\n{result}')
+
     async def html_get(self, url):
         access_token = await self.get_twitch_access_token()
         if access_token:
             headers = {'Client-ID': TwitchAPI.CLIENT_ID,
                        'Authorization': f'Bearer {access_token}'}
-            connector = aiohttp.TCPConnector(limit=60)
-            async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
-                try:
-                    async with session.get(url) as resp:
-                        if resp.status == 200:
-                            return resp
-                        else:
-                            print(f'GET to {url} failed:\n{resp.status}:{resp.reason}')
-                            return None
-                except aiohttp.ClientConnectionError as e:
-                    print(f'An error occurred while fetching data from '
-                          f'{TwitchAPI.APP_ACCESS_TOKEN_URL}:\n{e}')
+            await host_rate_limiter.acquire(url, BACKGROUND)
+            try:
+                async with self.aiohttp_session.get(url, headers=headers) as resp:
+                    if resp.status == 200:
+                        return resp
+                    else:
+                        if resp.status == 401:
+                            self.token_manager.invalidate()
+                        print(f'GET to {url} failed:\n{resp.status}:{resp.reason}')
+                        return None
+            except aiohttp.ClientConnectionError as e:
+                print(f'An error occurred while fetching data from '
+                      f'{url}:\n{e}')
 
     async def json_get(self, url):
         access_token = await self.get_twitch_access_token()
         if access_token:
             headers = {'Client-ID': TwitchAPI.CLIENT_ID,
                        'Authorization': f'Bearer {access_token}'}
-            connector = aiohttp.TCPConnector(limit=60)
-            async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
-                try:
-                    async with session.get(url) as resp:
-                        if resp.status == 200:
-                            return await resp.json()
-                        else:
-                            print(f'GET to {url} failed:\n{resp.status}:{resp.reason}')
-                            return None
-                except aiohttp.ClientConnectionError as e:
-                    print(f'An error occurred while fetching data from '
-                          f'{url}:\n{e}')
-                    return None
-
-    @staticmethod
-    async def json_post(url):
-        headers = {'Client-ID': TwitchAPI.CLIENT_ID}
-        connector = aiohttp.TCPConnector(limit=60)
-        async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+            await host_rate_limiter.acquire(url, BACKGROUND)
             try:
-                async with session.post(url) as resp:
+                async with self.aiohttp_session.get(url, headers=headers) as resp:
                     if resp.status == 200:
                         return await resp.json()
-                    elif resp.status == 400:
-                        print(f'POST to {url} failed:\n{resp.status}:{resp.reason}')
+                    else:
+                        if resp.status == 401:
+                            self.token_manager.invalidate()
+                        print(f'GET to {url} failed:\n{resp.status}:{resp.reason}')
                         return None
             except aiohttp.ClientConnectionError as e:
-                print(f'An error occurred while posting data to '
-                      f'{TwitchAPI.APP_ACCESS_TOKEN_URL}:\n{e}')
+                print(f'An error occurred while fetching data from '
+                      f'{url}:\n{e}')
                 return None
-            except TimeoutError as e:
-                print('')
 
-    async def get_twitch_access_token(self):
-        access_token = self.config.get('twitch_api', 'access_token')
+    async def json_post(self, url):
         headers = {'Client-ID': TwitchAPI.CLIENT_ID}
-        if not await self.access_token_is_valid(access_token):
-            print(f'Twitch access token is not valid: {access_token}\n'
-                  f'Fetching new Twitch access token...')
-            resp = await Utils(self.aiohttp_session).resp_get(
-                TwitchAPI.APP_ACCESS_TOKEN_URL, headers=headers)
-            while resp.status != 200:
-                print('Cannot fetch new access token, retrying in 30 seconds')
-                await asyncio.sleep(30)
-                resp = await Utils(self.aiohttp_session).resp_get(
-                    TwitchAPI.APP_ACCESS_TOKEN_URL, headers=headers)
-            access_token = resp['access_token']
-            self.config.set('twitch_api', 'access_token', access_token)
-            with open('config.ini', 'w') as configfile:
-                self.config.write(configfile)
-            print(f'New Twitch access token: {access_token}')
-            return access_token
-        return access_token
-
-    async def access_token_is_valid(self, access_token):
-        validation_url = 'https://id.twitch.tv/oauth2/validate'
-        headers = {'Authorization': f'OAuth {access_token}'}
-        resp = await Utils(self.aiohttp_session).resp_get(validation_url, headers=headers)
-        if resp.status == 200:
-            return True
-        return False
-
-    async def get_twitch_channel_status(self, username: str):
+        await host_rate_limiter.acquire(url, BACKGROUND)
+        try:
+            async with self.aiohttp_session.post(url, headers=headers) as resp:
+                if resp.status == 200:
+                    return await resp.json()
+                else:
+                    print(f'POST to {url} failed:\n{resp.status}:{resp.reason}')
+                    return None
+        except aiohttp.ClientConnectionError as e:
+            print(f'An error occurred while posting data to '
+                  f'{url}:\n{e}')
+            return None
+        except asyncio.TimeoutError as e:
+            print(f'POST to {url} timed out:\n{e}')
+            return None
+
+    async def get_twitch_access_token(self):
+        """
+        Returns the Twitch app access token held in memory by the token manager.
+
+        :return: The access token if successful, otherwise None
+        """
+        return await self.token_manager.get_token()
+
+    async def get_twitch_streams(self, usernames):
+        """
+        Fetches the live status of many channels, using one Helix /streams request per
+        batch of up to 100 logins. Batches are requested concurrently.
+
+        :param usernames: A list of Twitch logins
+        :return: A dict of login: stream data for live channels and login: None for
+        offline channels. Logins from a batch that failed are left out.
+        """
+        batch_size = self.streams_batch_size
+        batches = [usernames[i:i + batch_size]
+                   for i in range(0, len(usernames), batch_size)]
+        results = await asyncio.gather(
+            *[self.get_twitch_streams_batch(batch) for batch in batches])
+        streams = {}
+        for batch, resp in zip(batches, results):
+            if resp is None or 'data' not in resp:
+                print(f'Could not fetch stream status for: {", ".join(batch)}')
+                continue
+            streams.update({username.lower(): None for username in batch})
+            for stream in resp['data']:  # non-live streams are not returned
+                streams[stream['user_login'].lower()] = stream
+        return streams
+
+    async def get_twitch_streams_batch(self, usernames):
         access_token = await self.get_twitch_access_token()
         if access_token:
             headers = {'Client-ID': TwitchAPI.CLIENT_ID,
                        'Authorization': f'Bearer {access_token}'}
-            url = f'https://api.twitch.tv/helix/streams?user_login={username}'
-            resp = await Utils(self.aiohttp_session).json_get(url, headers=headers)
+            logins = '&'.join(f'user_login={username}' for username in usernames)
+            url = f'https://api.twitch.tv/helix/streams?first=100&{logins}'
+            resp = await Utils(self.aiohttp_session).json_get(
+                url, headers=headers, priority=BACKGROUND)
             return resp
 
-    async def get_twitch_game_name(self, twitch_game_id):
+    async def helix_get_many(self, endpoint, param, values):
+        """
+        Fetches several Helix objects in as few requests as possible by repeating the
+        query parameter, up to 100 values per request.
+
+        :param endpoint: Helix endpoint name, e.g. games or users
+        :param param: The repeated query parameter, e.g. id or login
+        :param values: The values to look up
+        :return: A list of the returned data objects
+        """
         access_token = await self.get_twitch_access_token()
-        if access_token:
-            headers = {'Client-ID': TwitchAPI.CLIENT_ID,
-                       'Authorization': f'Bearer {access_token}'}
-            url = f'https://api.twitch.tv/helix/games?id={twitch_game_id}'
-            resp = await Utils(self.aiohttp_session).json_get(url, headers=headers)
-            try:
-                return resp['data'][0]['name']
-            except IndexError as e:
-                print(f'Get game name failed:\n{e}')
-                return ''
+        if not access_token or len(values) == 0:
+            return []
+        headers = {'Client-ID': TwitchAPI.CLIENT_ID,
+                   'Authorization': f'Bearer {access_token}'}
+        batches = [values[i:i + 100] for i in range(0, len(values), 100)]
+        results = await asyncio.gather(*[
+            Utils(self.aiohttp_session).json_get(
+                f'https://api.twitch.tv/helix/{endpoint}?'
+                + '&'.join(f'{param}={value}' for value in batch),
+                headers=headers, priority=BACKGROUND)
+            for batch in batches])
+        data = []
+        for resp in results:
+            if resp is not None and 'data' in resp:
+                data.extend(resp['data'])
+        return data
+
+    async def get_twitch_game_names(self, twitch_game_ids):
+        """
+        Looks up game names, only asking Twitch for ids missing from the cache.
+
+        :param twitch_game_ids: A list of Twitch game ids
+        :return: A dict of game id: game name
+        """
+        names = {}
+        missing = []
+        for game_id in set(twitch_game_ids):
+            if not game_id:  # streams without a category
+                names[game_id] = ''
+                continue
+            name = self.game_cache.get(game_id)
+            if name is None:
+                missing.append(game_id)
+            else:
+                names[game_id] = name
+        for game in await self.helix_get_many('games', 'id', missing):
+            self.game_cache.set(game['id'], game['name'])
+            names[game['id']] = game['name']
+        for game_id in missing:
+            if game_id not in names:
+                print(f'Get game name failed for game id {game_id}')
+                names[game_id] = ''
+        return names
+
+    async def get_twitch_game_name(self, twitch_game_id):
+        return (await self.get_twitch_game_names([twitch_game_id]))[twitch_game_id]
+
+    async def get_twitch_users(self, login_names):
+        """
+        Looks up user profiles, only asking Twitch for logins missing from the cache.
+
+        :param login_names: A list of Twitch logins
+        :return: A dict of login: user data for every login Twitch knows about
+        """
+        users = {}
+        missing = []
+        for login_name in set(login.lower() for login in login_names):
+            user_data = self.user_cache.get(login_name)
+            if user_data is None:
+                missing.append(login_name)
+            else:
+                users[login_name] = user_data
+        for user_data in await self.helix_get_many('users', 'login', missing):
+            self.user_cache.set(user_data['login'].lower(), user_data)
+            users[user_data['login'].lower()] = user_data
+        return users
+
+    async def get_twitch_user_data(self, login_name):
+        return (await self.get_twitch_users([login_name])).get(login_name.lower())
 
     async def create_new_live_stream_embed(self, stream: dict, game_name):
-        embed = discord.Embed(url=f'https://www.twitch.tv/{stream["user_name"]}')
-        user_data = await self.get_twitch_user_data(stream['user_name'])
-        profile_image = user_data['profile_image_url']
-        embed.set_image(url=profile_image)
+        embed = discord.Embed(url=f'https://www.twitch.tv/{stream["user_login"]}')
+        user_data = await self.get_twitch_user_data(stream['user_login'])
+        if user_data is not None:
+            embed.set_image(url=user_data['profile_image_url'])
         try:
             embed.title = (f'{stream["user_name"]} just went live on Twitch with '
                            f'{game_name}!')
@@ -214,18 +523,6 @@ class Twitch(commands.Cog):
         embed.description = stream["title"]
         return embed
 
-    async def get_twitch_user_data(self, login_name):
-        access_token = await self.get_twitch_access_token()
-        if access_token:
-            headers = {'Client-ID': TwitchAPI.CLIENT_ID,
-                       'Authorization': f'Bearer {access_token}'}
-            url = f'https://api.twitch.tv/helix/users?login={login_name}'
-            resp = await Utils(self.aiohttp_session).json_get(url, headers=headers)
-            try:
-                return resp['data'][0]
-            except TypeError as e:
-                return None
-
 
 def setup(casper):
     casper.add_cog(Twitch(casper))
@@ -0,0 +1,113 @@
+"""
+File: twitch_token.py
+
+This file contains the in-memory holder for the Twitch app access token. The token is
+validated against id.twitch.tv at most once an hour, as Twitch recommends, instead of
+before every Helix request, and rotated tokens are written back to config.ini off the
+event loop.
+"""
+
+import asyncio
+import time
+
+from config import TwitchAPI
+from rate_limits import BACKGROUND
+from utilities import Utilities as Utils
+
+
+class TwitchTokenManager:
+    validation_url = 'https://id.twitch.tv/oauth2/validate'
+
+    def __init__(self, aiohttp_session, config, config_path='config.ini',
+                 validate_interval=3600, expiry_margin=60):
+        """
+        :param aiohttp_session: Session used for the validate/token requests
+        :param config: The ConfigParser holding the `twitch_api` section
+        :param config_path: Where the config is persisted when the token rotates
+        :param validate_interval: Max seconds between token validations
+        :param expiry_margin: Seconds before expiry at which the token is replaced
+        """
+        self.aiohttp_session = aiohttp_session
+        self.config = config
+        self.config_path = config_path
+        self.validate_interval = validate_interval
+        self.expiry_margin = expiry_margin
+        self.access_token = config.get('twitch_api', 'access_token', fallback=None)
+        self.expires_at = 0
+        self.validated_at = 0
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self):
+        now = time.monotonic()
+        return (self.access_token is not None and
+                now < self.expires_at - self.expiry_margin and
+                now - self.validated_at < self.validate_interval)
+
+    async def get_token(self):
+        """
+        Returns the current app access token, validating or replacing it only when the
+        hourly validation is due or the token is about to expire.
+
+        :return: The access token if successful, otherwise None
+        """
+        if self._is_fresh():
+            return self.access_token
+        async with self._lock:
+            if self._is_fresh():  # another caller refreshed while we waited
+                return self.access_token
+            if self.access_token is not None and await self._validate():
+                return self.access_token
+            print(f'Twitch access token is not valid: {self.access_token}\n'
+                  f'Fetching new Twitch access token...')
+            return await self._fetch()
+
+    def invalidate(self):
+        """
+        Forces the next get_token call to validate the token, e.g. after a 401.
+
+        :return: None
+        """
+        self.validated_at = 0
+
+    async def _validate(self):
+        headers = {'Authorization': f'OAuth {self.access_token}'}
+        status, resp = await Utils(self.aiohttp_session).json_get_status(
+            self.validation_url, headers=headers, priority=BACKGROUND)
+        if status != 200:
+            return False
+        now = time.monotonic()
+        self.validated_at = now
+        self.expires_at = now + resp.get('expires_in', 0)
+        return True
+
+    async def _fetch(self):
+        requested_at = time.monotonic()
+        resp = await Utils(self.aiohttp_session).json_post(
+            TwitchAPI.APP_ACCESS_TOKEN_URL, headers={'Client-ID': TwitchAPI.CLIENT_ID},
+            priority=BACKGROUND)
+        if resp is None or 'access_token' not in resp:
+            print(f'Cannot fetch new Twitch access token:\n{resp}')
+            self.access_token = None
+            return None
+        self.access_token = resp['access_token']
+        self.validated_at = requested_at
+        self.expires_at = requested_at + resp.get('expires_in', 0)
+        print(f'New Twitch access token: {self.access_token}')
+        asyncio.get_event_loop().run_in_executor(
+            None, self._persist, self.access_token)
+        return self.access_token
+
+    def _persist(self, access_token):
+        """
+        Writes the token back to config.ini so a restart can reuse it. Runs in a
+        worker thread.
+
+        :param access_token: The token to store
+        :return: None
+        """
+        self.config.set('twitch_api', 'access_token', access_token)
+        try:
+            with open(self.config_path, 'w') as configfile:
+                self.config.write(configfile)
+        except OSError as e:
+            print(f'Could not persist Twitch access token:\n{e}')
@@ -0,0 +1,66 @@
+"""
+File: blizzard_token.py
+
+This file contains the in-memory cache for Blizzard API access tokens. A token is
+reused until shortly before it expires and concurrent callers share a single refresh.
+"""
+
+import asyncio
+import time
+
+from rate_limits import INTERACTIVE
+
+
+class BlizzardTokenManager:
+    def __init__(self, fetch_token, refresh_margin=300):
+        """
+        :param fetch_token: Coroutine function taking a priority and returning the
+        token response from Blizzard's OAuth endpoint, or None on failure
+        :param refresh_margin: Seconds before expiry at which a background refresh is
+        started while the current token keeps being handed out
+        """
+        self._fetch_token = fetch_token
+        self.refresh_margin = refresh_margin
+        self.token = None
+        self.expires_at = 0
+        self._refresh_task = None
+
+    async def get_token(self, priority=INTERACTIVE):
+        """
+        Returns a valid Blizzard access token, fetching a new one only when needed.
+
+        :param priority: Rate limiter lane used if a new token has to be fetched
+        :return: The token response dict containing `access_token` if successful,
+        otherwise None
+        """
+        now = time.monotonic()
+        if self.token is not None and now < self.expires_at:
+            if now >= self.expires_at - self.refresh_margin:
+                self._refresh(priority)
+            return self.token
+        return await asyncio.shield(self._refresh(priority))
+
+    def _refresh(self, priority):
+        """
+        Starts a token refresh unless one is already running.
+
+        :param priority: Rate limiter lane for the token request
+        :return: The asyncio.Task performing the refresh
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._fetch(priority))
+        return self._refresh_task
+
+    async def _fetch(self, priority):
+        requested_at = time.monotonic()
+        try:
+            token = await self._fetch_token(priority)
+        except Exception as e:
+            print(f'Error attempting to refresh Blizzard access token:\n{e}')
+            return self.token if time.monotonic() < self.expires_at else None
+        if token is None or 'access_token' not in token:
+            print(f'Blizzard did not return an access token:\n{token}')
+            return self.token if time.monotonic() < self.expires_at else None
+        self.token = token
+        self.expires_at = requested_at + token.get('expires_in', 0)
+        return token
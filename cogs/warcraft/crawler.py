@@ -0,0 +1,248 @@
+"""
+File: crawler.py
+
+This file contains the helpers used by the Warcraft cog to crawl character data from
+the raider.io API concurrently without exceeding the API's per-minute budget.
+"""
+
+import asyncio
+import heapq
+import math
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+
+from cogs.warcraft.database.db_models import realm_slug
+from rate_limits import BACKGROUND
+
+# A character to fetch this cycle. rank is the Blizzard roster rank, or None for
+# characters outside the guild roster, whose stored rank is left as is.
+# last_updated and last_changed are None for characters never crawled.
+CrawlTarget = namedtuple('CrawlTarget',
+                         'name realm region rank last_updated last_changed')
+
+
+def plan_crawl(roster, characters, region, first=()):
+    """
+    Merges the Blizzard guild roster with the stored characters into one list where
+    every character appears once, keyed by (name, realm, region). Characters in
+    `first` lead the list, then the rest of the guild members, then everyone else.
+    Guild members carry their roster rank, so the rank is written with the same fetch.
+
+    :param roster: A list of (name, realm slug, rank) tuples from the Blizzard API
+    :param characters: A list of stored characters with name, realm, region and
+    last_updated. Realms are compared by realm_slug, so Kel'Thuzad matches kelthuzad.
+    :param region: 2-letter abbreviation for the roster's region
+    :param first: (name, realm, region) keys to crawl before anyone else, e.g. the
+    members who just joined
+    :return: A list of CrawlTarget tuples
+    """
+    stored = {(character.name.lower(), realm_slug(character.realm),
+               character.region.lower()): character for character in characters}
+    targets = {}
+    for name, realm, rank in roster:
+        key = (name.lower(), realm_slug(realm), region.lower())
+        if key not in targets:
+            character = stored.get(key)
+            if character is not None:
+                targets[key] = CrawlTarget(*key, rank, character.last_updated,
+                                           character.last_changed)
+            else:
+                targets[key] = CrawlTarget(*key, rank, None, None)
+    for key, character in stored.items():
+        if key not in targets:
+            targets[key] = CrawlTarget(*key, None, character.last_updated,
+                                       character.last_changed)
+    first = set(first)
+    return sorted(targets.values(), key=lambda target: target[:3] not in first)
+
+
+class RefreshScheduler:
+    """
+    Decides which characters a crawl cycle fetches. A character whose score, ilvl or
+    weekly high moved within `active_window` is refreshed every `base_interval`. After
+    that the interval doubles each time the idle time doubles, up to `max_interval`,
+    so dormant characters cost a fetch every few hours instead of every cycle.
+    """
+
+    def __init__(self, base_interval=300, active_window=3600, max_interval=43200):
+        """
+        :param base_interval: Seconds between refreshes of an active character
+        :param active_window: Seconds since the last change a character counts as active
+        :param max_interval: Upper bound in seconds on the refresh interval
+        """
+        self.base_interval = base_interval
+        self.active_window = active_window
+        self.max_interval = max_interval
+
+    def interval(self, target, now):
+        """
+        :param target: A CrawlTarget tuple
+        :param now: The current datetime
+        :return: Seconds to wait after the last refresh of target
+        """
+        last_changed = target.last_changed or target.last_updated
+        if last_changed is None:
+            return 0
+        idle = (now - last_changed).total_seconds()
+        if idle <= self.active_window:
+            return self.base_interval
+        doublings = int(math.log2(idle / self.active_window)) + 1
+        return min(self.max_interval, self.base_interval * 2 ** doublings)
+
+    def due(self, targets, now=None, first=()):
+        """
+        Orders the characters that are due with a priority queue, most overdue first,
+        and drops the rest until a later cycle.
+
+        :param targets: A list of CrawlTarget tuples
+        :param now: The current datetime, defaults to datetime.now()
+        :param first: (name, realm, region) keys that are due now and go ahead of
+        everyone else
+        :return: A list of the CrawlTarget tuples due now
+        """
+        now = now or datetime.now()
+        first = set(first)
+        queue = []
+        for index, target in enumerate(targets):
+            if target[:3] in first or target.last_updated is None:
+                due_at = datetime.min
+            else:
+                due_at = target.last_updated + timedelta(
+                    seconds=self.interval(target, now))
+            heapq.heappush(queue, (target[:3] not in first, due_at, index, target))
+        due = []
+        # A few seconds of slack so a character refreshed near the start of the
+        # previous cycle does not slip to the one after
+        horizon = now + timedelta(seconds=30)
+        while queue and queue[0][1] <= horizon:
+            due.append(heapq.heappop(queue)[3])
+        return due
+
+
+class AIMDLimiter:
+    """
+    Bounds the number of in-flight requests during a crawl. The bound grows by one
+    after a full window of successful requests (additive increase) and is cut in half
+    whenever the API answers with a 429 or 5xx (multiplicative decrease).
+
+    Callers waiting for a slot are queued in two lanes, like the rate limiter's token
+    buckets. `async with limiter` waits in the background lane, while
+    `async with limiter.slot(INTERACTIVE)` takes the next free slot ahead of every
+    queued crawl request.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=12, decrease_factor=0.5):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.waiters = (deque(), deque())  # indexed by INTERACTIVE / BACKGROUND
+        self._successes = 0
+
+    async def __aenter__(self):
+        await self.acquire(BACKGROUND)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def slot(self, priority=BACKGROUND):
+        """
+        :param priority: INTERACTIVE or BACKGROUND
+        :return: An async context manager holding one slot for the given lane
+        """
+        return _Slot(self, priority)
+
+    async def acquire(self, priority=BACKGROUND):
+        """
+        Waits until a slot is free for the given lane and takes it.
+
+        :param priority: INTERACTIVE or BACKGROUND
+        :return: None
+        """
+        if self.in_flight < self.limit and not any(self.waiters[:priority + 1]):
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters[priority].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if not waiter.cancelled():  # the slot was handed over as we were cancelled
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        """
+        Hands free slots to queued callers, interactive lane first.
+
+        :return: None
+        """
+        for lane in self.waiters:
+            while lane and self.in_flight < self.limit:
+                waiter = lane.popleft()
+                if not waiter.done():  # skip cancelled callers
+                    self.in_flight += 1
+                    waiter.set_result(None)
+
+    def record(self, status):
+        """
+        Adjusts the concurrency limit based on the HTTP status of a finished request.
+
+        :param status: The HTTP status code, or None if the connection failed
+        :return: True if the caller should back off and retry, otherwise False
+        """
+        if status == 429 or status is None or status >= 500:
+            self._successes = 0
+            self.limit = max(self.minimum, int(self.limit * self.decrease_factor))
+            return True
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            self.limit = min(self.maximum, self.limit + 1)
+            self._wake()
+        return False
+
+
+class _Slot:
+    def __init__(self, limiter, priority):
+        self.limiter = limiter
+        self.priority = priority
+
+    async def __aenter__(self):
+        await self.limiter.acquire(self.priority)
+        return self.limiter
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.limiter.release()
+
+
+class BatchWriter:
+    """
+    Buffers crawled profiles and hands them to `flush` in batches, so a crawl commits
+    once per batch instead of once per character.
+    """
+
+    def __init__(self, flush, batch_size=50):
+        """
+        :param flush: Coroutine function taking a list of buffered items
+        :param batch_size: Number of items that triggers a flush
+        """
+        self._flush = flush
+        self.batch_size = batch_size
+        self.items = []
+
+    async def add(self, item):
+        self.items.append(item)
+        if len(self.items) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        items, self.items = self.items, []
+        if len(items) > 0:
+            await self._flush(items)
@@ -5,7 +5,11 @@ This file sets up the SQLAlchemy table ORM objects. This file is imported by any
 needing access to one or more of the defined table ORM objects below.
 """
 
-from sqlalchemy import Column, String, Boolean, Integer, DateTime
+import re
+import unicodedata
+from collections import namedtuple
+
+from sqlalchemy import Column, String, Boolean, Integer, DateTime, Index, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 
 from cogs.warcraft.database.db_engine_session_init import engine
@@ -15,6 +19,15 @@ Base = declarative_base()
 
 class WarcraftCharacter(Base):
     __tablename__ = 'Warcraft Characters'
+    __table_args__ = (
+        # get_guild_members (optionally by rank) and get_guilds. The member queries
+        # select every column, so each match is still read from the table; only
+        # get_guilds is answered from the index alone.
+        Index('ix_characters_guild_rank', 'guild', 'realm', 'region', 'guild_rank'),
+        # get_guild_keys, filtered and sorted on key level, rows read from the table
+        Index('ix_characters_guild_key_level', 'guild', 'realm', 'region',
+              'm_plus_key_level'),
+    )
     name = Column(String, primary_key=True)
     realm = Column(String, primary_key=True)
     region = Column(String)
@@ -30,6 +43,7 @@ class WarcraftCharacter(Base):
     m_plus_weekly_high = Column(Integer)
     m_plus_prev_weekly_high = Column(Integer)
     last_updated = Column(DateTime)
+    last_changed = Column(DateTime)  # last crawl that moved score, ilvl or weekly high
     # Expansion "Feature"
     covenant = Column(String)
     renown = Column(String)
@@ -37,6 +51,13 @@ class WarcraftCharacter(Base):
 
 class WarcraftCharacterWeeklyRun(Base):
     __tablename__ = 'Warcraft Character Weekly Runs'
+    __table_args__ = (
+        Index('ix_weekly_runs_run_id_character_name', 'run_id', 'character_name',
+              unique=True),
+        # get_run_counts is answered from the index alone, get_player_runs selects
+        # every column and reads each matching row from the table
+        Index('ix_weekly_runs_character_name', 'character_name', 'dungeon_level'),
+    )
     id = Column(Integer, autoincrement=True, primary_key=True)
     run_id = Column(String)
     character_name = Column(String)
@@ -44,4 +65,97 @@ class WarcraftCharacterWeeklyRun(Base):
     dungeon_level = Column(Integer)
 
 
+class WarcraftCrawlCycle(Base):
+    __tablename__ = 'Warcraft Crawl Cycles'
+    id = Column(Integer, autoincrement=True, primary_key=True)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)  # None while the cycle is running or was interrupted
+    planned = Column(Integer)
+    cursor = Column(Integer)  # characters attempted so far
+
+
+class WarcraftCrawlProgress(Base):
+    __tablename__ = 'Warcraft Crawl Progress'
+    __table_args__ = (
+        # resuming an interrupted cycle
+        Index('ix_crawl_progress_cycle_id', 'cycle_id'),
+    )
+    name = Column(String, primary_key=True)
+    realm = Column(String, primary_key=True)
+    region = Column(String)
+    cycle_id = Column(Integer)  # cycle of the last attempt
+    last_attempt = Column(DateTime)
+    last_success = Column(DateTime)
+
+
+# Read-only rows returned by the query methods whose results are never written back.
+# Fields follow the table's column order, so a Core select row maps straight onto them.
+CharacterRow = namedtuple('CharacterRow', WarcraftCharacter.__table__.columns.keys())
+WeeklyRunRow = namedtuple('WeeklyRunRow',
+                          WarcraftCharacterWeeklyRun.__table__.columns.keys())
+
+
+def realm_slug(realm):
+    """
+    Reduces a realm name to the slug the Blizzard API uses, so realm names from
+    raider.io, user input and Blizzard slugs compare equal, e.g. Kel'Thuzad and
+    kelthuzad, or Wyrmrest Accord and wyrmrest-accord.
+
+    :param realm: Realm name or slug
+    :return: The realm slug
+    """
+    realm = ''.join(char for char in unicodedata.normalize('NFKD', realm.lower())
+                    if not unicodedata.combining(char))
+    realm = re.sub(r"['()]", '', realm)
+    return re.sub(r'[\s-]+', '-', realm).strip('-')
+
+
+def upgrade_schema():
+    """
+    create_all() only creates missing tables, so columns and indexes added to a model
+    after its table already exists are created here. New columns are backfilled where
+    there is something sensible to copy. Duplicate weekly runs logged before the
+    unique index existed are dropped first so the index can be built. Realms stored
+    as raider.io realm names are rewritten to their realm_slug.
+
+    :return: None
+    """
+    characters_table = WarcraftCharacter.__table__
+    runs_table = WarcraftCharacterWeeklyRun.__table__
+    columns = {column['name'] for column in
+               inspect(engine).get_columns(characters_table.name)}
+    existing = {index['name'] for index in inspect(engine).get_indexes(runs_table.name)}
+    with engine.begin() as connection:
+        if 'last_changed' not in columns:
+            connection.execute(text(
+                f'ALTER TABLE "{characters_table.name}" ADD COLUMN last_changed DATETIME'))
+            connection.execute(text(
+                f'UPDATE "{characters_table.name}" SET last_changed = last_updated'))
+        keys = {(name, realm) for name, realm in connection.execute(text(
+            f'SELECT name, realm FROM "{characters_table.name}"'))}
+        for name, realm in keys:
+            slug = realm_slug(realm)
+            if slug == realm:
+                continue
+            if (name, slug) in keys:
+                # The roster sync inserted the member again under the slug. The old row
+                # keeps the crawled stats and key, the next sync restores the rank.
+                connection.execute(text(
+                    f'DELETE FROM "{characters_table.name}" '
+                    f'WHERE name = :name AND realm = :slug'), {'name': name, 'slug': slug})
+            connection.execute(text(
+                f'UPDATE "{characters_table.name}" SET realm = :slug '
+                f'WHERE name = :name AND realm = :realm'),
+                {'name': name, 'realm': realm, 'slug': slug})
+        if 'ix_weekly_runs_run_id_character_name' not in existing:
+            connection.execute(text(
+                f'DELETE FROM "{runs_table.name}" WHERE id NOT IN '
+                f'(SELECT MIN(id) FROM "{runs_table.name}" '
+                f'GROUP BY run_id, character_name)'))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
+
+
 Base.metadata.create_all(engine)
+upgrade_schema()
@@ -0,0 +1,139 @@
+from datetime import datetime
+
+from sqlalchemy import desc, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from cogs.warcraft.database.db_models import WarcraftCrawlCycle, WarcraftCrawlProgress, realm_slug
+from cogs.warcraft.database.db_engine_session_init import Session
+from storage import runs_in_db_thread
+
+
+class WarcraftCrawlCheckpointInterface:
+    @classmethod
+    @runs_in_db_thread
+    def start_cycle(cls, targets):
+        """
+        Starts a crawl cycle, or resumes the last one if it never finished, e.g.
+        because the bot restarted halfway through.
+
+        :param targets: The characters due this cycle, objects with name and realm
+        :return: A tuple of (cycle id, set of (name, realm) already attempted in the
+        cycle), or (None, empty set) if the checkpoint could not be written
+        """
+        session = Session()
+        try:
+            cycle = session.query(WarcraftCrawlCycle).order_by(
+                desc(WarcraftCrawlCycle.id)).first()
+            attempted = set()
+            if cycle is not None and cycle.finished_at is None:
+                attempted = set(session.query(
+                    WarcraftCrawlProgress.name, WarcraftCrawlProgress.realm).filter(
+                    WarcraftCrawlProgress.cycle_id == cycle.id).all())
+                cycle.planned = len(attempted | {(target.name, target.realm)
+                                                 for target in targets})
+            else:
+                cycle = WarcraftCrawlCycle(started_at=datetime.now(),
+                                           planned=len(targets), cursor=0)
+                session.add(cycle)
+            session.commit()
+            return cycle.id, attempted
+        except Exception as e:
+            session.rollback()
+            print(f'An error occurred while starting a crawl cycle:\n{e}')
+            return None, set()
+        finally:
+            session.close()
+
+    @classmethod
+    @runs_in_db_thread
+    def record_attempts(cls, cycle_id, attempts):
+        """
+        Stores the outcome of a batch of character fetches and advances the cycle's
+        cursor in the same transaction.
+
+        :param cycle_id: The id returned by start_cycle
+        :param attempts: A list of (name, realm, region, attempted_at, success) tuples
+        :return: True if the batch was committed, otherwise False
+        """
+        rows = [{'name': name, 'realm': realm, 'region': region, 'cycle_id': cycle_id,
+                 'last_attempt': attempted_at,
+                 'last_success': attempted_at if success else None}
+                for name, realm, region, attempted_at, success in attempts]
+        table = WarcraftCrawlProgress.__table__
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name, table.c.realm],
+            set_={'region': stmt.excluded.region,
+                  'cycle_id': stmt.excluded.cycle_id,
+                  'last_attempt': stmt.excluded.last_attempt,
+                  'last_success': func.coalesce(stmt.excluded.last_success,
+                                                table.c.last_success)})
+        session = Session()
+        success = False
+        try:
+            session.execute(stmt, rows)
+            session.query(WarcraftCrawlCycle).filter(
+                WarcraftCrawlCycle.id == cycle_id
+            ).update({WarcraftCrawlCycle.cursor: WarcraftCrawlCycle.cursor + len(rows)},
+                     synchronize_session=False)
+            session.commit()
+            success = True
+        except Exception as e:
+            session.rollback()
+            print(f'An error occurred while recording {len(rows)} crawl attempts:\n{e}')
+        finally:
+            session.close()
+            return success
+
+    @classmethod
+    @runs_in_db_thread
+    def finish_cycle(cls, cycle_id):
+        session = Session()
+        success = False
+        try:
+            session.query(WarcraftCrawlCycle).filter(
+                WarcraftCrawlCycle.id == cycle_id
+            ).update({WarcraftCrawlCycle.finished_at: datetime.now()},
+                     synchronize_session=False)
+            session.commit()
+            success = True
+        except Exception as e:
+            session.rollback()
+            print(f'An error occurred while finishing crawl cycle {cycle_id}:\n{e}')
+        finally:
+            session.close()
+            return success
+
+    @classmethod
+    @runs_in_db_thread
+    def get_latest_cycle(cls):
+        """
+        :return: A tuple of (WarcraftCrawlCycle, number of characters attempted in it
+        whose fetch failed), or (None, 0) if no crawl has run yet
+        """
+        session = Session()
+        cycle = session.query(WarcraftCrawlCycle).order_by(
+            desc(WarcraftCrawlCycle.id)).first()
+        failed = 0
+        if cycle is not None:
+            failed = session.query(WarcraftCrawlProgress).filter(
+                WarcraftCrawlProgress.cycle_id == cycle.id,
+                (WarcraftCrawlProgress.last_success.is_(None)) |
+                (WarcraftCrawlProgress.last_success < WarcraftCrawlProgress.last_attempt)
+            ).count()
+        session.close()
+        return cycle, failed
+
+    @classmethod
+    @runs_in_db_thread
+    def get_progress(cls, name, realm):
+        """
+        :param name: Character name
+        :param realm: Realm name, spaces are auto-sanitized
+        :return: The WarcraftCrawlProgress row for the character, or None
+        """
+        session = Session()
+        progress = session.query(WarcraftCrawlProgress).filter_by(
+            name=name.lower(), realm=realm_slug(realm)).first()
+        session.close()
+        return progress
@@ -1,73 +1,137 @@
+import time
+from collections import defaultdict, namedtuple
 from datetime import datetime
 from urllib import parse
 
-from sqlalchemy import desc, asc
+from sqlalchemy import bindparam, case, desc, asc, func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from cogs.warcraft.database.db_models import WarcraftCharacter
+from cogs.warcraft.database.db_models import WarcraftCharacter, WarcraftCharacterWeeklyRun, CharacterRow, realm_slug
 from cogs.warcraft.database.db_engine_session_init import Session
+from storage import runs_in_db_thread
+
+# Result of a roster sync. Each field is a list of (name, realm, region) keys.
+RosterDelta = namedtuple('RosterDelta', 'joined left rank_changed')
 
 
 class WarcraftCharacterInterface:
+    # A change in any of these marks the character as active for refresh scheduling
+    activity_columns = ('m_plus_score_overall', 'ilvl', 'm_plus_weekly_high')
+
     @classmethod
-    async def update_character(cls, raiderio_data, rank=None):
+    async def update_character(cls, raiderio_data, rank=None, roster_guild=None):
         """
         Updates an existing character if found, otherwise creates a new entry.
 
         :param raiderio_data: A list of character data returned by the Raider.io API
         :param rank: Passed in during auto crawl of guilds from Blizzard API
+        :param roster_guild: See bulk_update_characters
         :return: None
         """
+        await cls.bulk_update_characters([(raiderio_data, rank)], report=False,
+                                         roster_guild=roster_guild)
+
+    @classmethod
+    @runs_in_db_thread
+    def bulk_update_characters(cls, payloads, report=True, roster_guild=None):
+        """
+        Inserts or updates a batch of characters with a single upsert statement
+        (INSERT ... ON CONFLICT DO UPDATE) in one transaction.
+
+        :param payloads: A list of (raiderio_data, rank) tuples. rank may be None to keep
+        the guild rank already stored for the character.
+        :param report: Print how many rows were written and how fast
+        :param roster_guild: Guild whose membership is kept by sync_guild_roster. An
+        existing character's guild is left alone when either the stored or the
+        raider.io guild is this one, since raider.io lags behind the Blizzard roster.
+        :return: The number of characters written
+        """
+        rows = []
+        for raiderio_data, rank in payloads:
+            try:
+                rows.append(cls.character_row(raiderio_data, rank))
+            except (KeyError, IndexError, TypeError) as e:
+                print(f'Skipping malformed raider.io data for '
+                      f'{raiderio_data.get("name")}:\n{e}')
+        if len(rows) == 0:
+            return 0
+        table = WarcraftCharacter.__table__
+        stmt = sqlite_insert(table)
+        changed = or_(*[table.c[column].isnot(stmt.excluded[column])
+                        for column in cls.activity_columns])
+        guild = stmt.excluded.guild
+        if roster_guild is not None:
+            roster_guild = roster_guild.lower().replace(' ', '-')
+            guild = case([((table.c.guild == roster_guild) |
+                           (stmt.excluded.guild == roster_guild), table.c.guild)],
+                         else_=stmt.excluded.guild)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.name, table.c.realm],
+            set_={**{column: stmt.excluded[column] for column in rows[0]
+                     if column not in ('name', 'realm', 'guild', 'guild_rank',
+                                       'last_changed')},
+                  'guild': guild,
+                  # Crawls without roster info must not wipe a known guild rank
+                  'guild_rank': func.coalesce(stmt.excluded.guild_rank,
+                                              table.c.guild_rank),
+                  'last_changed': case([(changed, stmt.excluded.last_updated)],
+                                       else_=table.c.last_changed)}
+        )
         session = Session()
-        name = raiderio_data['name'].lower()
-        realm = raiderio_data['realm'].replace(' ', '-').lower()
-        region = raiderio_data['region'].lower()
-        character = session.query(WarcraftCharacter).filter_by(
-            name=name, realm=realm, region=region).first()
-        if character is None:
-            character = WarcraftCharacter()
-            character.name = name
-            character.realm = realm
-            character.region = region
-            character.m_plus_prev_weekly_high = 0
-        if raiderio_data['guild'] is not None:
-            character.guild = raiderio_data['guild']['name'].replace(' ', '-').lower()
-        else:
-            character.guild = ''
-        if rank is not None:
-            character.guild_rank = rank
-        else:
-            character.rank = None
-        character.char_class = raiderio_data['class'].lower()
-        character.ilvl = raiderio_data['gear']['item_level_equipped']
-        character.m_plus_score_overall = raiderio_data['mythic_plus_scores_by_season'][0]['scores']['all']
-        character.m_plus_rank_overall = raiderio_data['mythic_plus_ranks']['overall']['realm']
-        character.m_plus_rank_class = raiderio_data['mythic_plus_ranks']['class']['realm']
-        if len(raiderio_data['mythic_plus_weekly_highest_level_runs']) > 0:
-            character.m_plus_weekly_high = raiderio_data['mythic_plus_weekly_highest_level_runs'][0]['mythic_level']
-        else:
-            character.m_plus_weekly_high = 0
-        if len(raiderio_data['mythic_plus_previous_weekly_highest_level_runs']) > 0:
-            character.m_plus_prev_weekly_high = raiderio_data['mythic_plus_previous_weekly_highest_level_runs'][0]['mythic_level']
-        else:
-            character.m_plus_prev_weekly_high = 0
-        character.last_updated = datetime.now()
-        # Expansion "Feature"
-        if raiderio_data['covenant'] is not None:
-            character.covenant = raiderio_data['covenant']['name']
-            character.renown = raiderio_data['covenant']['renown_level']
-        else:
-            character.covenant = ''
-            character.renown = ''
+        started = time.perf_counter()
+        written = 0
         try:
-            session.add(character)
+            session.execute(stmt, rows)
             session.commit()
+            written = len(rows)
         except Exception as e:
             session.rollback()
-            print(f'An error occurred while updating a character:\n'
-                  f'{name.title()} on {realm.title()}-{region.title()}\n'
+            print(f'An error occurred while updating {len(rows)} characters:\n'
+                  f'{", ".join(row["name"].title() for row in rows)}\n'
                   f'ERROR: {e}')
         finally:
             session.close()
+        elapsed = time.perf_counter() - started
+        if report and written > 0:
+            print(f'Wrote {written} characters in {elapsed:.3f}s '
+                  f'({written / max(elapsed, 1e-6):,.0f} rows/s).')
+        return written
+
+    @staticmethod
+    def character_row(raiderio_data, rank=None):
+        """
+        Maps raider.io character data onto WarcraftCharacter columns.
+
+        :param raiderio_data: A list of character data returned by the Raider.io API
+        :param rank: Guild rank from the Blizzard API, if known
+        :return: A dict of column: value
+        """
+        r = raiderio_data
+        weekly_highs = r['mythic_plus_weekly_highest_level_runs']
+        prev_weekly_highs = r['mythic_plus_previous_weekly_highest_level_runs']
+        now = datetime.now()
+        return {
+            'name': r['name'].lower(),
+            'realm': realm_slug(r['realm']),
+            'region': r['region'].lower(),
+            'guild': (r['guild']['name'].replace(' ', '-').lower()
+                      if r['guild'] is not None else ''),
+            'guild_rank': rank,
+            'char_class': r['class'].lower(),
+            'ilvl': r['gear']['item_level_equipped'],
+            'm_plus_score_overall': r['mythic_plus_scores_by_season'][0]['scores']['all'],
+            'm_plus_rank_overall': r['mythic_plus_ranks']['overall']['realm'],
+            'm_plus_rank_class': r['mythic_plus_ranks']['class']['realm'],
+            'm_plus_weekly_high': (weekly_highs[0]['mythic_level']
+                                   if len(weekly_highs) > 0 else 0),
+            'm_plus_prev_weekly_high': (prev_weekly_highs[0]['mythic_level']
+                                        if len(prev_weekly_highs) > 0 else 0),
+            'last_updated': now,
+            'last_changed': now,  # kept as is on update unless activity_columns moved
+            # Expansion "Feature"
+            'covenant': r['covenant']['name'] if r['covenant'] is not None else '',
+            'renown': r['covenant']['renown_level'] if r['covenant'] is not None else '',
+        }
 
     @classmethod
     async def remove_character(cls, character):
@@ -77,18 +141,183 @@ class WarcraftCharacterInterface:
         :param character: a WarcraftCharacter object returned by get_character()
         :return: None
         """
+        await cls.remove_characters([character])
+
+    @classmethod
+    @runs_in_db_thread
+    def remove_characters(cls, characters):
+        """
+        Removes many characters with one DELETE per realm, all in one transaction.
+
+        :param characters: A list of objects with name and realm attributes
+        :return: The number of characters removed
+        """
+        names_by_realm = defaultdict(list)
+        for character in characters:
+            names_by_realm[character.realm].append(character.name)
+        session = Session()
+        removed = 0
+        try:
+            for realm, names in names_by_realm.items():
+                removed += session.query(WarcraftCharacter).filter(
+                    WarcraftCharacter.realm == realm,
+                    WarcraftCharacter.name.in_(names)
+                ).delete(synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            removed = 0
+            print(f'An error occurred while attempting to delete characters:\n{e}')
+        finally:
+            session.close()
+        return removed
+
+    @classmethod
+    async def remove_guild(cls, guild, realm, region):
+        """
+        Removes every member of a guild with a single DELETE.
+
+        :param guild: Guild name, spaces are auto-sanitized
+        :param realm: Realm name, spaces are auto-sanitized
+        :param region: 2-letter abbreviation for region - US, EU, RU, KR
+        :return: The number of characters removed
+        """
+        return await cls._delete_where(
+            WarcraftCharacter.guild == guild.lower().replace(' ', '-'),
+            WarcraftCharacter.realm == realm_slug(realm),
+            WarcraftCharacter.region == region.lower())
+
+    @classmethod
+    async def remove_non_guild_characters(cls, guild):
+        """
+        Removes every character that is not a member of the given guild.
+
+        :param guild: Guild name, spaces are auto-sanitized
+        :return: The number of characters removed
+        """
+        return await cls._delete_where(or_(
+            WarcraftCharacter.guild.is_(None),
+            WarcraftCharacter.guild != guild.lower().replace(' ', '-')))
+
+    @classmethod
+    @runs_in_db_thread
+    def _delete_where(cls, *criteria):
         session = Session()
+        removed = 0
         try:
-            session.delete(character)
+            removed = session.query(WarcraftCharacter).filter(*criteria).delete(
+                synchronize_session=False)
             session.commit()
         except Exception as e:
             session.rollback()
-            print(f'An error occurred while attempting to delete a character:\n{e}')
+            removed = 0
+            print(f'An error occurred while attempting to delete characters:\n{e}')
         finally:
             session.close()
+        return removed
 
     @classmethod
-    async def get_character(cls, name, realm, region):
+    @runs_in_db_thread
+    def sync_guild_roster(cls, guild, region, roster, max_left_share=0.5):
+        """
+        Brings the stored guild membership in line with the Blizzard roster in one
+        transaction. Members not stored yet are inserted with empty stats until their
+        first crawl, stored characters who joined or changed rank are updated, and
+        members missing from the roster are marked as having left by clearing their
+        guild and rank. Their character data is kept.
+
+        An empty roster, or one that would mark more than max_left_share of the stored
+        members as left, is taken to be a partial answer from the API and nothing is
+        changed.
+
+        :param guild: Guild name, spaces are auto-sanitized
+        :param region: 2-letter abbreviation for region - US, EU, RU, KR
+        :param roster: A list of (name, realm slug, rank) tuples from the Blizzard API
+        :param max_left_share: Largest share of the stored members a sync may remove
+        :return: A RosterDelta if the sync was committed, otherwise None
+        """
+        guild = guild.lower().replace(' ', '-')
+        region = region.lower()
+        if len(roster) == 0:
+            print(f'The roster for {guild} is empty, skipping the sync.')
+            return None
+        ranks = {(name.lower(), realm_slug(realm), region): rank
+                 for name, realm, rank in roster}
+        table = WarcraftCharacter.__table__
+        session = Session()
+        try:
+            stored = {(row.name, realm_slug(row.realm), row.region): row
+                      for row in session.execute(
+                table.select().with_only_columns(
+                    [table.c.name, table.c.realm, table.c.region, table.c.guild,
+                     table.c.guild_rank]).where(
+                    (table.c.guild == guild) |
+                    table.c.name.in_(sorted({key[0] for key in ranks}))))}
+            joined, left, rank_changed, inserts, updates = [], [], [], [], []
+
+            def update(row, rank, member_of):
+                # Keyed on the row as stored, so a realm stored before it was slugged
+                # is still matched
+                updates.append({'b_name': row.name, 'b_realm': row.realm,
+                                'b_region': row.region, 'guild': member_of,
+                                'guild_rank': rank})
+
+            for key, rank in ranks.items():
+                row = stored.get(key)
+                if row is None:
+                    joined.append(key)
+                    inserts.append(cls.new_member_row(*key, guild, rank))
+                elif row.guild != guild:
+                    joined.append(key)
+                    update(row, rank, guild)
+                elif row.guild_rank != rank:
+                    rank_changed.append(key)
+                    update(row, rank, guild)
+            for key, row in stored.items():
+                # Members added by a command rather than a sync have no rank, they
+                # leave all the same
+                if row.guild == guild and key not in ranks:
+                    left.append(key)
+                    update(row, None, '')
+            members = sum(1 for row in stored.values() if row.guild == guild)
+            if len(left) > 1 and len(left) > max_left_share * members:
+                print(f'The roster for {guild} would remove {len(left)} of {members} '
+                      f'members, skipping the sync.')
+                return None
+            if len(inserts) > 0:
+                session.execute(table.insert(), inserts)
+            if len(updates) > 0:
+                session.execute(table.update().where(
+                    (table.c.name == bindparam('b_name')) &
+                    (table.c.realm == bindparam('b_realm')) &
+                    (table.c.region == bindparam('b_region'))
+                ).values(guild=bindparam('guild'), guild_rank=bindparam('guild_rank')),
+                    updates)
+            session.commit()
+            return RosterDelta(joined, left, rank_changed)
+        except Exception as e:
+            session.rollback()
+            print(f'An error occurred while syncing the roster for {guild}:\n{e}')
+            return None
+        finally:
+            session.close()
+
+    @staticmethod
+    def new_member_row(name, realm, region, guild, rank):
+        """
+        :return: A row for a guild member that has not been crawled yet. Stats are
+        zeroed rather than null so the guild layouts can render it right away.
+        """
+        return {'name': name, 'realm': realm, 'region': region, 'guild': guild,
+                'guild_rank': rank, 'char_class': '', 'ilvl': 0,
+                'm_plus_score_overall': 0, 'm_plus_rank_overall': 0,
+                'm_plus_rank_class': 0, 'm_plus_weekly_high': 0,
+                'm_plus_prev_weekly_high': 0, 'last_updated': None,
+                'last_changed': None, 'covenant': '', 'renown': ''}
+
+    @classmethod
+    @runs_in_db_thread
+    def get_character(cls, name, realm, region):
         """
         Retrieves a character from the database. Presumes the character was
         found to exist already.
@@ -100,25 +329,24 @@ class WarcraftCharacterInterface:
         """
         session = Session()
         character = session.query(WarcraftCharacter).filter_by(
-            name=name.lower(), realm=realm.lower().replace(' ', '-'),
+            name=name.lower(), realm=realm_slug(realm),
             region=region.lower()).first()
         session.close()
         return character
 
     @classmethod
-    async def get_all_characters(cls):
+    @runs_in_db_thread
+    def get_all_characters(cls):
         """
         Returns all characters found in the database.
 
-        :return: A list of WarcraftCharacter objects
+        :return: A list of CharacterRow tuples
         """
-        session = Session()
-        characters = session.query(WarcraftCharacter).all()
-        session.close()
-        return characters
+        return cls._select_rows(WarcraftCharacter.__table__.select())
 
     @classmethod
-    async def get_guild_members(cls, guild, realm, region, ranks=None):
+    @runs_in_db_thread
+    def get_guild_members(cls, guild, realm, region, ranks=None):
         """
         Returns all members belonging to the specified guild.
 
@@ -126,25 +354,20 @@ class WarcraftCharacterInterface:
         :param realm: Realm name, spaces are auto-sanitized
         :param region: 2-letter abbreviation for region - US, EU, RU, KR
         :param ranks: A list of numerical ranks to return filtered guild members
-        :return: A list of WarcraftCharacter objects
+        :return: A list of CharacterRow tuples
         """
-        session = Session()
-        if ranks is None:
-            guild_members = session.query(WarcraftCharacter).filter_by(
-                guild=guild.lower().replace(' ', '-'), realm=realm.lower().replace(' ', '-'),
-                region=region.lower()).all()
-            session.close()
-            return guild_members
-        else:
-            guild_members = session.query(WarcraftCharacter).filter_by(
-                guild=guild.lower().replace(' ', '-'), realm=realm.lower().replace(' ', '-'),
-                region=region.lower()).filter(
-                WarcraftCharacter.guild_rank.in_(ranks)).all()
-            session.close()
-            return guild_members
+        table = WarcraftCharacter.__table__
+        stmt = table.select().where(
+            (table.c.guild == guild.lower().replace(' ', '-')) &
+            (table.c.realm == realm_slug(realm)) &
+            (table.c.region == region.lower()))
+        if ranks is not None:
+            stmt = stmt.where(table.c.guild_rank.in_(ranks))
+        return cls._select_rows(stmt)
 
     @classmethod
-    async def get_guilds(cls):
+    @runs_in_db_thread
+    def get_guilds(cls):
         """
         Gets all guilds currently in the database.
 
@@ -153,88 +376,107 @@ class WarcraftCharacterInterface:
         session = Session()
         guilds = session.query(
             WarcraftCharacter.guild, WarcraftCharacter.realm, WarcraftCharacter.region
-        ).distinct()
+        ).distinct().all()
         session.close()
         return guilds
 
     @classmethod
-    async def addkey(cls, character, key_name, key_level):
+    @runs_in_db_thread
+    def addkey(cls, character, key_name, key_level):
         """
         Adds mythic+ key info for a character.
 
         :param character: Name of character
         :param key_name: Full dungeon name
         :param key_level: Level of the key as int
-        :return: None
+        :return: True if the key was saved, otherwise False
         """
         session = Session()
         character.m_plus_key = key_name
         character.m_plus_key_level = key_level
+        success = False
         try:
             session.add(character)
             session.commit()
+            success = True
         except Exception as e:
-            print('An error occurred when adding a key:\n{e}')
+            print(f'An error occurred when adding a key:\n{e}')
             session.rollback()
         finally:
             session.close()
+            return success
 
     @classmethod
-    async def removekey(cls, character):
+    @runs_in_db_thread
+    def removekey(cls, character):
         """
         Removes a mythic+ key for a character.
 
         :param character: Name of character
-        :return: None
+        :return: True if the key was removed, otherwise False
         """
         session = Session()
         character.m_plus_key = None
         character.m_plus_key_level = None
+        success = False
         try:
             session.add(character)
             session.commit()
+            success = True
         except Exception as e:
-            print('An error occurred when removing a key:\n{e}')
+            print(f'An error occurred when removing a key:\n{e}')
             session.rollback()
         finally:
             session.close()
+            return success
 
     @classmethod
-    async def get_guild_keys(cls, guild, realm, region):
+    @runs_in_db_thread
+    def get_guild_keys(cls, guild, realm, region):
         """
         Gets all the guild members that have a mythic+ key for the week.
 
         :param guild: Name of guild, spaces are auto-sanitized
         :param realm: Realm name, spaces are auto-sanitized
         :param region: 2-letter abbreviation for region - US, EU, RU, KR
-        :return: A list of WarcraftCharacter objects
+        :return: A list of CharacterRow tuples
+        """
+        table = WarcraftCharacter.__table__
+        return cls._select_rows(table.select().where(
+            (table.c.guild == guild.lower().replace(' ', '-')) &
+            (table.c.realm == realm_slug(realm)) &
+            (table.c.region == region.lower()) &
+            (table.c.m_plus_key_level > 1)
+        ).order_by(desc(table.c.m_plus_key_level), asc(table.c.name)))
+
+    @staticmethod
+    def _select_rows(stmt):
+        """
+        Runs a Core select over the characters table. Rows are read straight into
+        CharacterRow tuples, skipping the identity map and attribute instrumentation
+        of ORM instances that would be detached as soon as the session closes.
+
+        :param stmt: A select of every WarcraftCharacter column
+        :return: A list of CharacterRow tuples
         """
         session = Session()
-        results = session.query(WarcraftCharacter).filter_by(
-            guild=guild.lower().replace(' ', '-'), realm=realm.lower().replace(' ', '-'),
-            region=region.lower()).filter(
-            WarcraftCharacter.m_plus_key_level > 1).order_by(
-            desc(WarcraftCharacter.m_plus_key_level)).order_by(
-            asc(WarcraftCharacter.name)).all()
-        session.close()
-        return results
+        try:
+            return [CharacterRow(*row) for row in session.execute(stmt)]
+        finally:
+            session.close()
 
     @classmethod
-    async def reset_keys(cls):
+    @runs_in_db_thread
+    def reset_keys(cls):
         """
         Resets mythic+ keys for the week.
 
         :return: None
         """
         session = Session()
-        characters = session.query(WarcraftCharacter).filter(
-            WarcraftCharacter.m_plus_key is not None).all()
-        for char in characters:
-            char.m_plus_key = None
-            char.m_plus_key_level = None
-            session.add(char)
         success = False
         try:
+            cls._reset_keys(session)
             session.commit()
             success = True
         except Exception as e:
@@ -243,3 +485,35 @@ class WarcraftCharacterInterface:
         finally:
             session.close()
             return success
+
+    @classmethod
+    @runs_in_db_thread
+    def weekly_reset(cls):
+        """
+        Clears this week's keys and weekly runs in a single transaction, so the write
+        lock is only held for one UPDATE and one DELETE.
+
+        :return: True if the reset was committed, otherwise False
+        """
+        session = Session()
+        success = False
+        try:
+            cls._reset_keys(session)
+            session.query(WarcraftCharacterWeeklyRun).delete(synchronize_session=False)
+            session.commit()
+            success = True
+        except Exception as e:
+            print(f'An error occurred during the weekly reset.\n{e}')
+            session.rollback()
+        finally:
+            session.close()
+            return success
+
+    @staticmethod
+    def _reset_keys(session):
+        session.query(WarcraftCharacter).filter(
+            WarcraftCharacter.m_plus_key.isnot(None) |
+            WarcraftCharacter.m_plus_key_level.isnot(None)
+        ).update({WarcraftCharacter.m_plus_key: None,
+                  WarcraftCharacter.m_plus_key_level: None},
+                 synchronize_session=False)
@@ -1,47 +1,93 @@
-from cogs.warcraft.database.db_models import WarcraftCharacterWeeklyRun
+from sqlalchemy import func, insert
+
+from cogs.warcraft.database.db_models import WarcraftCharacterWeeklyRun, WeeklyRunRow
 from cogs.warcraft.database.db_engine_session_init import Session
+from storage import runs_in_db_thread
 
 
 class WarcraftCharacterWeeklyRunsInterface:
     @classmethod
     async def add_run(cls, run_id, character_name, dungeon_name, dungeon_level):
+        return await cls.add_runs([{'run_id': run_id, 'character_name': character_name,
+                                    'dungeon_name': dungeon_name,
+                                    'dungeon_level': dungeon_level}])
+
+    @classmethod
+    @runs_in_db_thread
+    def add_runs(cls, runs):
+        """
+        Stores a batch of weekly runs with a single INSERT OR IGNORE statement. Runs
+        already stored for a character are skipped by the (run_id, character_name)
+        unique index instead of being looked up first.
+
+        :param runs: A list of dicts with run_id, character_name, dungeon_name and
+        dungeon_level
+        :return: True if the batch was committed, otherwise False
+        """
+        if len(runs) == 0:
+            return True
+        rows = [{**run, 'character_name': run['character_name'].lower()} for run in runs]
         session = Session()
-        existing_run = session.query(WarcraftCharacterWeeklyRun).filter_by(
-            run_id=run_id, character_name=character_name.lower()).first()
-        if existing_run is None:
-            new_run = WarcraftCharacterWeeklyRun()
-            new_run.run_id = run_id
-            new_run.character_name = character_name.lower()
-            new_run.dungeon_name = dungeon_name
-            new_run.dungeon_level = dungeon_level
-            success = False
-            try:
-                session.add(new_run)
-                session.commit()
-                success = True
-            except Exception as e:
-                print(f'An error occurred while adding a new weekly guild mplus run:\n{e}')
-                session.rollback()
-            finally:
-                session.close()
+        success = False
+        try:
+            session.execute(
+                insert(WarcraftCharacterWeeklyRun.__table__).prefix_with('OR IGNORE'),
+                rows)
+            session.commit()
+            success = True
+        except Exception as e:
+            print(f'An error occurred while adding {len(rows)} weekly guild mplus runs:\n'
+                  f'{e}')
+            session.rollback()
+        finally:
+            session.close()
             return success
 
     @classmethod
-    async def get_player_runs(cls, character_name):
+    @runs_in_db_thread
+    def get_player_runs(cls, character_name):
+        """
+        :param character_name: Character name, lower case
+        :return: A list of WeeklyRunRow tuples
+        """
+        table = WarcraftCharacterWeeklyRun.__table__
+        session = Session()
+        try:
+            return [WeeklyRunRow(*row) for row in session.execute(
+                table.select().where(table.c.character_name == character_name))]
+        finally:
+            session.close()
+
+    @classmethod
+    @runs_in_db_thread
+    def get_run_counts(cls, character_names):
+        """
+        Counts this week's runs for many characters with one grouped query.
+
+        :param character_names: A list of character names
+        :return: A dict of character name: number of runs. Characters without runs are
+        included with a count of 0.
+        """
+        names = [name.lower() for name in character_names]
+        counts = dict.fromkeys(names, 0)
+        if len(names) == 0:
+            return counts
         session = Session()
-        runs = session.query(WarcraftCharacterWeeklyRun).filter_by(
-            character_name=character_name).all()
+        counts.update(session.query(
+            WarcraftCharacterWeeklyRun.character_name,
+            func.count(WarcraftCharacterWeeklyRun.id)
+        ).filter(WarcraftCharacterWeeklyRun.character_name.in_(names)).group_by(
+            WarcraftCharacterWeeklyRun.character_name).all())
         session.close()
-        return runs
+        return counts
 
     @classmethod
-    async def reset_runs(cls):
+    @runs_in_db_thread
+    def reset_runs(cls):
         session = Session()
-        runs = session.query(WarcraftCharacterWeeklyRun).all()
         success = False
         try:
-            for r in runs:
-                session.delete(r)
+            session.query(WarcraftCharacterWeeklyRun).delete(synchronize_session=False)
             session.commit()
             success = True
         except Exception as e:
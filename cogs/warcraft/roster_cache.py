@@ -0,0 +1,156 @@
+"""
+File: roster_cache.py
+
+This file contains the in-memory read model of the default guild's roster. The roster
+only changes when a crawl finishes or when someone adds, removes or clears a key, so
+readycheck, scores, callout and keys read it from here instead of querying the
+database on every invocation. The layouts built from it are kept as well, until the
+roster next changes.
+"""
+
+import time
+from datetime import datetime
+
+from cogs.warcraft.database.db_models import realm_slug
+from cogs.warcraft.db_interfaces.warcraft_character_iface import WarcraftCharacterInterface
+from cogs.warcraft.db_interfaces.weekly_gulld_runs_iface import WarcraftCharacterWeeklyRunsInterface
+
+
+class GuildRoster:
+    def __init__(self, guild, realm, region, max_age=900):
+        """
+        :param guild: Guild name, spaces are auto-sanitized
+        :param realm: Realm name, spaces are auto-sanitized
+        :param region: 2-letter abbreviation for region - US, EU, RU, KR
+        :param max_age: Seconds after which the roster is reloaded on the next read
+        """
+        self.guild = guild.lower().replace(' ', '-')
+        self.realm = realm_slug(realm)
+        self.region = region.lower()
+        self.max_age = max_age
+        self.members = {}  # character name: CharacterRow
+        self.run_counts = {}  # character name: number of weekly runs
+        self.loaded_at = None
+        self.version = 0  # bumped on every change, so readers can tell it changed
+        self._loaded_monotonic = None
+        self._rendered = {}  # (command, *options): output built at _rendered_version
+        self._rendered_version = 0
+
+    def age(self):
+        """
+        :return: Seconds since the roster was loaded, or None if it never was
+        """
+        if self._loaded_monotonic is None:
+            return None
+        return time.monotonic() - self._loaded_monotonic
+
+    def is_stale(self):
+        age = self.age()
+        return age is None or age > self.max_age
+
+    async def refresh(self):
+        """
+        Reloads every guild member and their weekly run counts from the database.
+
+        :return: None
+        """
+        members = await WarcraftCharacterInterface.get_guild_members(
+            self.guild, self.realm, self.region)
+        run_counts = await WarcraftCharacterWeeklyRunsInterface.get_run_counts(
+            [member.name for member in members])
+        self.members = {member.name: member for member in members}
+        self.run_counts = run_counts
+        self.loaded_at = datetime.now()
+        self._loaded_monotonic = time.monotonic()
+        self.version += 1
+
+    async def ensure_fresh(self):
+        """
+        Reloads the roster only if it was never loaded or has outlived max_age, e.g.
+        because the crawl has stopped.
+
+        :return: None
+        """
+        if self.is_stale():
+            await self.refresh()
+
+    def get_members(self, ranks=None):
+        """
+        :param ranks: An iterable of integer ranks, or a comma-separated string of them,
+        to filter by. None returns every member.
+        :return: A new list of CharacterRow tuples
+        """
+        if ranks is None:
+            return list(self.members.values())
+        ranks = self.parse_ranks(ranks)
+        return [member for member in self.members.values() if member.guild_rank in ranks]
+
+    def get_keys(self):
+        """
+        :return: Members holding a mythic+ key, highest key first and then by name, the
+        same order as WarcraftCharacterInterface.get_guild_keys
+        """
+        members = [member for member in self.members.values()
+                   if member.m_plus_key_level is not None and member.m_plus_key_level > 1]
+        members.sort(key=lambda x: x.name)
+        members.sort(key=lambda x: x.m_plus_key_level, reverse=True)
+        return members
+
+    def set_key(self, name, key_name, key_level):
+        """
+        Applies an addkey or removekey that was already written to the database.
+
+        :param name: Character name
+        :param key_name: Full dungeon name, or None to clear the key
+        :param key_level: Level of the key as int, or None to clear the key
+        :return: None
+        """
+        member = self.members.get(name.lower())
+        if member is not None:
+            self.members[member.name] = member._replace(m_plus_key=key_name,
+                                                        m_plus_key_level=key_level)
+            self.version += 1
+
+    def remove(self, name):
+        """
+        Drops a character that was already removed from the database.
+
+        :param name: Character name
+        :return: None
+        """
+        if self.members.pop(name.lower(), None) is not None:
+            self.run_counts.pop(name.lower(), None)
+            self.version += 1
+
+    def get_rendered(self, key):
+        """
+        Returns a layout built from the current version of the roster. Everything
+        rendered from an older version is dropped first.
+
+        :param key: A tuple of the command name and the options that shape its output
+        :return: The cached output, or None if it has to be built
+        """
+        if self._rendered_version != self.version:
+            self._rendered = {}
+            self._rendered_version = self.version
+        return self._rendered.get(key)
+
+    def set_rendered(self, key, output):
+        if self._rendered_version == self.version:
+            self._rendered[key] = output
+
+    def rendered_count(self):
+        return len(self._rendered) if self._rendered_version == self.version else 0
+
+    def rank_key(self, ranks):
+        """
+        :param ranks: Ranks as accepted by get_members
+        :return: A hashable form of ranks, so '1,0' and '0,1' share a render cache entry
+        """
+        return None if ranks is None else tuple(sorted(self.parse_ranks(ranks)))
+
+    @staticmethod
+    def parse_ranks(ranks):
+        if isinstance(ranks, str):
+            return {int(rank) for rank in ranks.split(',') if rank.strip().isdigit()}
+        return {int(rank) for rank in ranks}
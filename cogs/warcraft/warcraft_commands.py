@@ -1,16 +1,24 @@
 import asyncio
+import functools
 import random
 import string
+import time
 from datetime import datetime
 from typing import List
 from urllib import parse
 
 import discord
 from discord.ext import commands, tasks
-from ratelimiter import RateLimiter
 
+from cache import TTLCache
+from rate_limits import BACKGROUND, INTERACTIVE
 from utilities import Utilities
-from cogs.warcraft.db_interfaces.warcraft_character_iface import WarcraftCharacterInterface, WarcraftCharacter
+from cogs.warcraft.blizzard_token import BlizzardTokenManager
+from cogs.warcraft.crawler import AIMDLimiter, BatchWriter, RefreshScheduler, plan_crawl
+from cogs.warcraft.roster_cache import GuildRoster
+from cogs.warcraft.database.db_models import realm_slug
+from cogs.warcraft.db_interfaces.crawl_checkpoint_iface import WarcraftCrawlCheckpointInterface
+from cogs.warcraft.db_interfaces.warcraft_character_iface import WarcraftCharacterInterface, CharacterRow
 from cogs.warcraft.db_interfaces.weekly_gulld_runs_iface import WarcraftCharacterWeeklyRunsInterface, WarcraftCharacterWeeklyRun
 from config import WarcraftAPI
 
@@ -39,74 +47,139 @@ class Warcraft(commands.Cog):
             'Theater of Pain': ('top', 'theater', 'pain'),
         }
 
-        async def crawl_all_characters():
+        self.blizzard_token_manager = BlizzardTokenManager(
+            self.fetch_blizzard_access_token)
+        self.crawl_limiter = AIMDLimiter(initial=4, maximum=12)
+        self.crawl_retries = 2
+        self.crawl_batch_size = 50  # characters written per database transaction
+        self.refresh_scheduler = RefreshScheduler(base_interval=300)
+        # (name, realm, region) of characters just fetched by a command; the crawl
+        # neither refetches them nor overwrites them with its own, possibly older, data
+        self.fresh_lookups = TTLCache(maxsize=1000,
+                                      ttl=self.refresh_scheduler.base_interval)
+        self.roster = GuildRoster(self.guild_name, self.guild_realm, self.region)
+
+        async def crawl_character(target, writer, progress=None):
             """
-            Gets a list of all characters from the database and then pulls updated
-            information from raider.io. If the character cannot be fetched from raider.io,
+            Pulls updated information from raider.io for a single character. Backs off
+            and retries if raider.io is throttling us or erroring.
+
+            :param target: A CrawlTarget tuple
+            :param writer: The BatchWriter buffering updated characters, whose
+            successful attempts are checkpointed once they are written
+            :param progress: The BatchWriter buffering failed attempts for the crawl
+            checkpoint, if any
+            :return: True if the character was updated, otherwise False
+            """
+            if target[:3] in self.fresh_lookups:
+                return False
+            attempted_at = datetime.now()
+            for attempt in range(self.crawl_retries + 1):
+                async with self.crawl_limiter:
+                    status, raiderio_data = await self.get_raiderio_profile(
+                        target.name, target.realm, target.region)
+                if not self.crawl_limiter.record(status):
+                    break
+                if attempt < self.crawl_retries:
+                    await asyncio.sleep(2 ** attempt)
+            attempt = (target.name, target.realm, target.region, attempted_at)
+            if raiderio_data is not None:
+                await writer.add((raiderio_data, target.rank, attempt))
+                return True
+            if progress is not None:
+                await progress.add((*attempt, False))
+            elif (status in (400, 404) and target.last_updated is not None and
+                  abs((datetime.now() - target.last_updated)).days > 30):
+                print(f'{target.name} removed for being old.')
+                await WarcraftCharacterInterface.remove_character(target)
+                self.roster.remove(target.name)
+            return False
+
+        async def crawl_characters():
+            """
+            Syncs guild membership against the roster from Blizzard, then pulls updated
+            information from raider.io for every member and stored character that is
+            due, once each and several characters at a time, starting with members who
+            just joined. Dormant characters are due less often, see RefreshScheduler. If
+            a stored character cannot be fetched from raider.io for 30 days, it is
+            removed.
+
+            Progress is checkpointed in batches, so if the bot restarts mid-cycle the
+            next crawl resumes the same cycle and skips the characters already
+            attempted in it.
 
             :return: None
             """
-            rate_limiter = RateLimiter(max_calls=120, period=60)
+            members = await self.get_guild_members_from_blizzard(
+                self.guild_name, self.guild_realm, self.region)
+            joined = []
+            if not members:
+                print('Could not fetch guild members, crawling stored characters only.')
+            else:
+                delta = await WarcraftCharacterInterface.sync_guild_roster(
+                    self.guild_name, self.region, members)
+                if delta is not None:
+                    joined = delta.joined
+                    for label, keys in zip(('Joined', 'Left', 'Rank changed'), delta):
+                        if len(keys) > 0:
+                            print(f'{label}: {", ".join(key[0].title() for key in keys)}')
             characters = await WarcraftCharacterInterface.get_all_characters()
-            if len(characters) > 0:
-                for character in characters:
-                    try:
-                        async with rate_limiter:
-                            raiderio_data = await self.get_raiderio_data(
-                                character.name, character.realm, character.region)
-                            if raiderio_data is not None:
-                                await WarcraftCharacterInterface.update_character(raiderio_data)
-                                await self.log_weekly_runs(raiderio_data)
-                            elif abs((datetime.now() - character.last_updated)).days > 30:
-                                print(f'{character.name} removed for being old.')
-                                await WarcraftCharacterInterface.remove_character(character)
-                    except Exception as e:
+            planned = plan_crawl(members or [], characters, self.region, first=joined)
+            targets = self.refresh_scheduler.due(planned, first=joined)
+            print(f'{len(targets)}/{len(planned)} characters due for a refresh.')
+            if len(targets) > 0:
+                cycle_id, attempted = await WarcraftCrawlCheckpointInterface.start_cycle(
+                    targets)
+                if len(attempted) > 0:
+                    targets = [target for target in targets
+                               if (target.name, target.realm) not in attempted]
+                    print(f'Resuming crawl cycle {cycle_id}: {len(attempted)} characters '
+                          f'already attempted, {len(targets)} to go.')
+                progress = None
+                if cycle_id is not None:
+                    progress = BatchWriter(
+                        functools.partial(WarcraftCrawlCheckpointInterface.record_attempts,
+                                          cycle_id), self.crawl_batch_size)
+                writer = BatchWriter(
+                    functools.partial(self.write_crawl_batch, cycle_id=cycle_id),
+                    self.crawl_batch_size)
+                started = time.perf_counter()
+                results = await asyncio.gather(
+                    *[crawl_character(target, writer, progress) for target in targets],
+                    return_exceptions=True)
+                await writer.flush()
+                if progress is not None:
+                    await progress.flush()
+                    await WarcraftCrawlCheckpointInterface.finish_cycle(cycle_id)
+                elapsed = time.perf_counter() - started
+                for target, result in zip(targets, results):
+                    if isinstance(result, Exception):
                         print(f'Error occurred when attempting to retrieve character data '
-                              f'for {character.name} during '
-                              f'character crawl:\n{e}')
-                        continue
-            else:
-                print('No characters found to update.')
-
-        async def crawl_guild():
-            rate_limiter = RateLimiter(max_calls=120, period=60)
-            members = await self.get_guild_members_from_blizzard(
-                    self.guild_name, self.guild_realm, self.region)
-            if len(members) > 0:
-                for name, realm, rank in members:
-                    try:
-                        async with rate_limiter:
-                            raiderio_data = await self.get_raiderio_data(
-                                name, realm, self.region)
-                            if raiderio_data is not None:
-                                await WarcraftCharacterInterface.update_character(
-                                    raiderio_data, rank)
-                    except Exception as e:
-                        print(f'Error occurred during crawl Felforged and character '
-                              f'{name}:\n{e}')
-                        continue
+                              f'for {target.name} during '
+                              f'character crawl:\n{result}')
+                updated = len([result for result in results if result is True])
+                print(f'Updated {updated}/{len(targets)} characters '
+                      f'({len(members or [])} guild members, {len(characters)} stored) in '
+                      f'{elapsed:.1f}s ({len(targets) / elapsed:.2f} characters/s, '
+                      f'concurrency limit now {self.crawl_limiter.limit}).')
             else:
-                print('Could not fetch guild members during crawl_guild.')
+                print('No characters due for an update.')
 
         @tasks.loop(seconds=300)
         async def auto_crawl():
             """
-            Auto-runs every 10 minutes. Calls two methods, crawl_all_characters and
-            crawl_all_guilds. The first ensures all guild members and guild ranks are
-            crawled, the latter ensures all characters are updated.
+            Auto-runs every 5 minutes. Crawls the guild roster and the stored characters
+            that are due in a single pass, fetching each character once, then reloads
+            the in-memory guild roster.
 
             :return: None
             """
             print('----------------------------------------')
-            print(f'Crawling Felforged starting at {datetime.now()}.')
-            await crawl_guild()
-            print(f'Finished crawling Felforged at {datetime.now()}.')
-            print('----------------------------------------')
-            print('----------------------------------------')
             print(f'Crawling all characters starting at {datetime.now()}.')
-            await crawl_all_characters()
+            await crawl_characters()
             print(f'Finished crawling all characters at {datetime.now()}.')
             print('----------------------------------------')
+            await self.roster.refresh()
 
         auto_crawl.start()
 
@@ -115,8 +188,8 @@ class Warcraft(commands.Cog):
             # Felforged pve channel
             ch = self.casper.get_channel(647918497342423052)
             if datetime.now().weekday() == 1 and datetime.now().hour == 10:
-                if (await WarcraftCharacterInterface.reset_keys() and
-                        await WarcraftCharacterWeeklyRunsInterface.reset_runs()):
+                if await WarcraftCharacterInterface.weekly_reset():
+                    await self.roster.refresh()
                     await ch.send('Weekly reset, keys and weekly runs reset. Wish you '
                                   'good loot and stable connect!')
                     await asyncio.sleep(24*60*60)
@@ -221,7 +294,8 @@ class Warcraft(commands.Cog):
         #     print(f'{k}: {v}')
         await msg.edit(content=f'Found character data, updating records.')
         try:
-            await WarcraftCharacterInterface.update_character(raiderio_data)
+            await WarcraftCharacterInterface.update_character(
+                raiderio_data, roster_guild=self.guild_name)
         except Exception as e:
             await self.react_to_message(ctx.message, False)
             print(f'Error occurred during wow command character update:\n{e.with_traceback()}')
@@ -283,10 +357,15 @@ class Warcraft(commands.Cog):
                              f'{self.guild_name.replace("-", "").title()} '
                              f'on {self.guild_realm.replace("-", " ").title()}'
                              f'-{self.region.upper()}.')
-        guild_members = await WarcraftCharacterInterface.get_guild_members(
-            self.guild_name, self.guild_realm, self.region, ranks)
-        await msg.edit(content=f'Members found. Building layout.')
-        output = await self.build_readycheck_msg(guild_members, sort_by)
+        await self.roster.ensure_fresh()
+        key = ('readycheck', sort_by, self.roster.rank_key(ranks))
+        output = self.roster.get_rendered(key)
+        if output is None:
+            guild_members = self.roster.get_members(ranks)
+            await msg.edit(content=f'Members found. Building layout.')
+            output = await self.build_readycheck_msg(guild_members, sort_by,
+                                                     self.roster.run_counts)
+            self.roster.set_rendered(key, output)
         await self.react_to_message(ctx.message, True)
         if ctx.channel.id == 267749130829299729:
             return await msg.edit(content=output)  # don't delete in officer channel
@@ -305,10 +384,14 @@ class Warcraft(commands.Cog):
          message
         """
         msg = await ctx.send(f'Fetching scores for the top {num} characters in the guild.')
-        characters = await WarcraftCharacterInterface.get_guild_members(
-            self.guild_name, self.guild_realm, self.region)
-        await msg.edit(content=f'Building layout.')
-        output = await self.build_scores_msg(characters, num)
+        await self.roster.ensure_fresh()
+        key = ('scores', num)
+        output = self.roster.get_rendered(key)
+        if output is None:
+            characters = self.roster.get_members()
+            await msg.edit(content=f'Building layout.')
+            output = await self.build_scores_msg(characters, num)
+            self.roster.set_rendered(key, output)
         await self.react_to_message(ctx.message, True)
         return await msg.edit(content='', embed=output, delete_after=300)
 
@@ -359,13 +442,24 @@ class Warcraft(commands.Cog):
             return await ctx.send(out_msg, delete_after=300)
         character = await WarcraftCharacterInterface.get_character(
             name, self.guild_realm, self.region)
+        if character is None:  # not crawled yet, look it up ahead of the crawl
+            raiderio_data = await self.get_raiderio_data(name, self.guild_realm,
+                                                         self.region)
+            if raiderio_data is not None:
+                await WarcraftCharacterInterface.update_character(
+                    raiderio_data, roster_guild=self.guild_name)
+                await self.roster.refresh()
+                character = await WarcraftCharacterInterface.get_character(
+                    name, self.guild_realm, self.region)
         if character is None:
             await self.react_to_message(ctx.message, False)
             return await ctx.send(f'Could not find character by name of: {name.title()}.'
                                   f'Please try using the `wow` command to scan your '
                                   f'character.', delete_after=300)
-        await WarcraftCharacterInterface.addkey(character, key, key_level)
-        return await self.react_to_message(ctx.message, True)
+        if await WarcraftCharacterInterface.addkey(character, key, key_level):
+            self.roster.set_key(name, key, key_level)
+            return await self.react_to_message(ctx.message, True)
+        return await self.react_to_message(ctx.message, False)
 
     @commands.command(aliases=['rk'])
     async def removekey(self, ctx, name=None):
@@ -385,8 +479,10 @@ class Warcraft(commands.Cog):
             return await ctx.send(f'Could not find character by name of: {name.title()}. '
                                   f'This message will delete itself in 30 seconds.',
                                   delete_after=300)
-        await WarcraftCharacterInterface.removekey(character)
-        return await self.react_to_message(ctx.message, True)
+        if await WarcraftCharacterInterface.removekey(character):
+            self.roster.set_key(name, None, None)
+            return await self.react_to_message(ctx.message, True)
+        return await self.react_to_message(ctx.message, False)
 
     @commands.command()
     async def remove(self, ctx, name):
@@ -404,6 +500,7 @@ class Warcraft(commands.Cog):
             return await ctx.send(f'Could not find character by name of: {name.title()}.',
                                   delete_after=300)
         await WarcraftCharacterInterface.remove_character(character)
+        self.roster.remove(name)
         return await self.react_to_message(ctx.message, True)
     # endregion
 
@@ -422,10 +519,14 @@ class Warcraft(commands.Cog):
                              f'{self.guild_name.replace("-", "").title()} '
                              f'on {self.guild_realm.replace("-", " ").title()}'
                              f'-{self.region.upper()}.')
-        guild_members = await WarcraftCharacterInterface.get_guild_members(
-            self.guild_name, self.guild_realm, self.region, ranks)
-        await msg.edit(content=f'Members found. Building layout.')
-        output = await self.build_callout_msg(guild_members)
+        await self.roster.ensure_fresh()
+        key = ('callout', self.roster.rank_key(ranks))
+        output = self.roster.get_rendered(key)
+        if output is None:
+            guild_members = self.roster.get_members(ranks)
+            await msg.edit(content=f'Members found. Building layout.')
+            output = await self.build_callout_msg(guild_members)
+            self.roster.set_rendered(key, output)
         await self.react_to_message(ctx.message, True)
         return await msg.edit(content=output)
 
@@ -437,9 +538,11 @@ class Warcraft(commands.Cog):
         :param ctx: Discord.py invocation context. Used for sending messages.
         :return: An output of mythic+ key information
         """
-        guild_keys_output = await self.build_guild_keys_msg(
-            await WarcraftCharacterInterface.get_guild_keys(
-                self.guild_name, self.guild_realm, self.region))
+        await self.roster.ensure_fresh()
+        guild_keys_output = self.roster.get_rendered(('keys',))
+        if guild_keys_output is None:
+            guild_keys_output = await self.build_guild_keys_msg(self.roster.get_keys())
+            self.roster.set_rendered(('keys',), guild_keys_output)
         await self.react_to_message(ctx.message, True)
         return await ctx.send(guild_keys_output)
 
@@ -517,11 +620,8 @@ class Warcraft(commands.Cog):
     async def removeall(self, ctx):
         if ctx.author.id != self.casper.owner_id:
             return
-        characters = await WarcraftCharacterInterface.get_all_characters()
-        characters = [character for character in characters
-                      if character.guild is not 'felforged']
-        for char in characters:
-            await WarcraftCharacterInterface.remove_character(char)
+        await WarcraftCharacterInterface.remove_non_guild_characters(self.guild_name)
+        await self.roster.refresh()
         return await self.react_to_message(ctx.message, True)
 
     @commands.command(hidden=True)
@@ -537,19 +637,66 @@ class Warcraft(commands.Cog):
         """
         if ctx.author.id != self.casper.owner_id:
             return
-        guild_members = await WarcraftCharacterInterface.get_guild_members(
-            guild_name, realm, region)
-        if len(guild_members) == 0:
+        if await WarcraftCharacterInterface.remove_guild(guild_name, realm, region) == 0:
             await self.react_to_message(ctx.message, False)
             return await ctx.send(f'Could not find guild by name of: {guild_name.title()}.')
-        for character in guild_members:
-            await WarcraftCharacterInterface.remove_character(character)
+        await self.roster.refresh()
         return await self.react_to_message(ctx.message, True)
 
+    @commands.command(hidden=True)
+    async def rostercache(self, ctx):
+        if ctx.author.id != self.casper.owner_id:
+            return
+        age = self.roster.age()
+        if age is None:
+            return await ctx.send('The guild roster has not been loaded yet.')
+        return await ctx.send(
+            f'```Members:  {len(self.roster.members)}\n'
+            f'Loaded:   {self.roster.loaded_at:%Y-%m-%d %H:%M:%S} ({age:.0f}s ago)\n'
+            f'Stale:    {"yes" if self.roster.is_stale() else "no"} '
+            f'(reloads after {self.roster.max_age}s)\n'
+            f'Version:  {self.roster.version}\n'
+            f'Renders:  {self.roster.rendered_count()} cached```')
+
+    @commands.command(hidden=True)
+    async def crawlstatus(self, ctx, name=None, realm='wyrmrest-accord'):
+        """
+        Shows the progress of the current or last crawl cycle, or the last crawl
+        attempt and success for a single character.
+
+        :param ctx: Discord.py invocation context. Used for sending messages.
+        :param name: Character name, optional
+        :param realm: Realm name, spaces are auto-sanitized
+        :return: A message with the crawl progress
+        """
+        if ctx.author.id != self.casper.owner_id:
+            return
+        if name is not None:
+            progress = await WarcraftCrawlCheckpointInterface.get_progress(name, realm)
+            if progress is None:
+                return await ctx.send(f'{name.title()} has not been crawled yet.')
+            last_success = ('never' if progress.last_success is None else
+                            f'{progress.last_success:%Y-%m-%d %H:%M:%S}')
+            return await ctx.send(
+                f'```{progress.name.title()} ({progress.realm}-{progress.region.upper()})\n'
+                f'Cycle:         {progress.cycle_id}\n'
+                f'Last attempt:  {progress.last_attempt:%Y-%m-%d %H:%M:%S}\n'
+                f'Last success:  {last_success}```')
+        cycle, failed = await WarcraftCrawlCheckpointInterface.get_latest_cycle()
+        if cycle is None:
+            return await ctx.send('No crawl cycle has run yet.')
+        state = (f'finished {cycle.finished_at:%Y-%m-%d %H:%M:%S}'
+                 if cycle.finished_at is not None else 'running or interrupted')
+        return await ctx.send(
+            f'```Cycle:     {cycle.id} ({state})\n'
+            f'Started:   {cycle.started_at:%Y-%m-%d %H:%M:%S}\n'
+            f'Progress:  {cycle.cursor}/{cycle.planned} characters attempted\n'
+            f'Failed:    {failed}```')
+
     @commands.command(hidden=True)
     async def reset(self, ctx):
-        if (await WarcraftCharacterInterface.reset_keys() and
-                await WarcraftCharacterWeeklyRunsInterface.reset_runs()):
+        if await WarcraftCharacterInterface.weekly_reset():
+            await self.roster.refresh()
             await ctx.send('Weekly reset, keys and weekly runs reset. Wish you '
                            'good loot and stable connect!')
         else:
@@ -571,17 +718,28 @@ class Warcraft(commands.Cog):
             return await msg.add_reaction('\U00002705')  # white checkmark in green box
         return await msg.add_reaction('\U0000274c')  # red cross mark X
 
-    async def get_blizzard_access_token(self):
+    async def get_blizzard_access_token(self, priority=INTERACTIVE):
+        """
+        Returns a cached access token for use with Blizzard API, only requesting a new
+        one from Blizzard when the cached token is close to expiring.
+
+        :param priority: Rate limiter lane, INTERACTIVE or BACKGROUND
+        :return: A Blizzard access token if successful, otherwise None
+        """
+        return await self.blizzard_token_manager.get_token(priority)
+
+    async def fetch_blizzard_access_token(self, priority=INTERACTIVE):
         """
-        Fetched an access token for use with Blizzard API.
+        Fetches a new access token for use with Blizzard API.
 
+        :param priority: Rate limiter lane, INTERACTIVE or BACKGROUND
         :return: A Blizzard access token if successful, otherwise None
         """
         url = (f'https://us.battle.net/oauth/token?grant_type='
                f'client_credentials&client_id={WarcraftAPI.API_CLIENTID}'
                f'&client_secret={WarcraftAPI.API_CLIENTSECRET}')
         try:
-            token = await Utilities(self.aiohttp_session).json_get(url)
+            token = await Utilities(self.aiohttp_session).json_get(url, priority=priority)
             return token
         except KeyError as e:
             print(f'Error attempting to generate access token:\n{e}')
@@ -626,24 +784,53 @@ class Warcraft(commands.Cog):
         else:
             return None
 
-    async def get_raiderio_data(self, name, realm, region):
+    async def get_raiderio_data(self, name, realm, region, priority=INTERACTIVE):
         """
-        Fetches character information from Raider.io API
+        Fetches character information from Raider.io API. The request shares the
+        crawl's concurrency slots; an interactive request takes the next free slot
+        ahead of queued crawl requests, and the character is then skipped by the crawl
+        until it is due again.
 
         :param name: Character name
         :param realm: Realm name, spaces are auto-sanitized
         :param region: 2-letter abbreviation for region - US, EU, RU, KR
-        :return: The returned Raider.io data
+        :param priority: Rate limiter lane, INTERACTIVE or BACKGROUND
+        :return: The returned Raider.io data, or None if raider.io did not answer with
+        a character profile, e.g. a 400 for an unknown character
         """
-        url = (f'https://raider.io/api/v1/characters/profile?region={region.lower()}'
-               f'&realm={realm.replace(" ", "-").lower()}'
-               f'&name={parse.quote(name)}'
-               f'&fields=gear,corruption,guild,raid_progression,mythic_plus_ranks,'
-               f'mythic_plus_recent_runs,mythic_plus_highest_level_runs,'
-               f'mythic_plus_weekly_highest_level_runs,'
-               f'mythic_plus_previous_weekly_highest_level_runs,'
-               f'mythic_plus_scores_by_season:current,covenant')
-        return await Utilities(self.aiohttp_session).json_get(url)
+        url = self.raiderio_profile_url(name, realm, region)
+        async with self.crawl_limiter.slot(priority):
+            status, raiderio_data = await Utilities(self.aiohttp_session).json_get_status(
+                url, priority=priority)
+        if status != 200 or raiderio_data is None or 'name' not in raiderio_data:
+            return None
+        if priority == INTERACTIVE:
+            self.fresh_lookups.set(self.character_key(raiderio_data), True)
+        return raiderio_data
+
+    async def get_raiderio_profile(self, name, realm, region):
+        """
+        Fetches character information from Raider.io API along with the HTTP status,
+        used by the crawls to adapt to throttling.
+
+        :param name: Character name
+        :param realm: Realm name, spaces are auto-sanitized
+        :param region: 2-letter abbreviation for region - US, EU, RU, KR
+        :return: A tuple of (status, Raider.io data)
+        """
+        return await Utilities(self.aiohttp_session).json_get_status(
+            self.raiderio_profile_url(name, realm, region), priority=BACKGROUND)
+
+    @staticmethod
+    def raiderio_profile_url(name, realm, region):
+        return (f'https://raider.io/api/v1/characters/profile?region={region.lower()}'
+                f'&realm={realm.replace(" ", "-").lower()}'
+                f'&name={parse.quote(name)}'
+                f'&fields=gear,corruption,guild,raid_progression,mythic_plus_ranks,'
+                f'mythic_plus_recent_runs,mythic_plus_highest_level_runs,'
+                f'mythic_plus_weekly_highest_level_runs,'
+                f'mythic_plus_previous_weekly_highest_level_runs,'
+                f'mythic_plus_scores_by_season:current,covenant')
 
     async def get_raiderio_guild_data(self, name, realm, region):
         url = (f'https://raider.io/api/v1/guilds/profile?'
@@ -662,7 +849,7 @@ class Warcraft(commands.Cog):
         :return: A list of character information containing name, realm, and guild rank
         if successful, otherwise None
         """
-        token = await self.get_blizzard_access_token()
+        token = await self.get_blizzard_access_token(priority=BACKGROUND)
         if token is not None:
             try:
                 url = (f'https://{region.lower()}.api.blizzard.com/data/wow/guild/'
@@ -670,7 +857,8 @@ class Warcraft(commands.Cog):
                        f'{parse.quote(guild_name.replace("-", " ")).lower()}'
                        f'/roster?namespace=profile-us&locale=en_US'
                        f'&access_token={token["access_token"]}')
-                results = await Utilities(self.aiohttp_session).json_get(url)
+                results = await Utilities(self.aiohttp_session).json_get(
+                    url, priority=BACKGROUND)
                 if results is None:
                     return None
                 members = []
@@ -692,14 +880,61 @@ class Warcraft(commands.Cog):
         return await Utilities(self.aiohttp_session).json_get(url)
 
     @staticmethod
-    async def log_weekly_runs(raiderio_data):
-        for dungeon in raiderio_data['mythic_plus_weekly_highest_level_runs']:
-            dungeon_name = dungeon['dungeon']
-            dungeon_level = dungeon['mythic_level']
-            run_id = dungeon['url'].split('/')[5].split('-')[0]
-            await WarcraftCharacterWeeklyRunsInterface.add_run(
-                run_id, raiderio_data['name'], dungeon_name, dungeon_level
-            )
+    def weekly_runs(raiderio_data):
+        """
+        Extracts this week's runs from raider.io character data.
+
+        :param raiderio_data: A list of character data returned by the Raider.io API
+        :return: A list of run dicts accepted by WarcraftCharacterWeeklyRunsInterface
+        """
+        return [{'run_id': dungeon['url'].split('/')[5].split('-')[0],
+                 'character_name': raiderio_data['name'],
+                 'dungeon_name': dungeon['dungeon'],
+                 'dungeon_level': dungeon['mythic_level']}
+                for dungeon in raiderio_data['mythic_plus_weekly_highest_level_runs']]
+
+    @staticmethod
+    def character_key(raiderio_data):
+        """
+        :param raiderio_data: A list of character data returned by the Raider.io API
+        :return: The (name, realm, region) key the character is stored under
+        """
+        return (raiderio_data['name'].lower(),
+                realm_slug(raiderio_data['realm']),
+                raiderio_data['region'].lower())
+
+    async def log_weekly_runs(self, raiderio_data):
+        await WarcraftCharacterWeeklyRunsInterface.add_runs(self.weekly_runs(raiderio_data))
+
+    async def write_crawl_batch(self, items, cycle_id=None):
+        """
+        Flushes a batch of crawled characters: one upsert for the characters and one
+        insert for all of their weekly runs. Characters a command fetched while the
+        batch was buffered are left out, since the command wrote fresher data.
+
+        The attempts are checkpointed only after the characters are committed, so a
+        crash in between makes a resumed cycle fetch them again rather than skip them.
+
+        :param items: A list of (raiderio_data, rank, (name, realm, region,
+        attempted_at)) tuples
+        :param cycle_id: The crawl cycle to checkpoint the attempts in, if any
+        :return: None
+        """
+        payloads = [(raiderio_data, rank) for raiderio_data, rank, _ in items
+                    if self.character_key(raiderio_data) not in self.fresh_lookups]
+        if len(payloads) > 0 and await WarcraftCharacterInterface.bulk_update_characters(
+                payloads, roster_guild=self.guild_name) == 0:
+            return  # nothing written, leave the attempts unrecorded so they are retried
+        runs = []
+        for raiderio_data, _ in payloads:
+            try:
+                runs.extend(self.weekly_runs(raiderio_data))
+            except (KeyError, IndexError, TypeError) as e:
+                print(f'Could not read weekly runs for {raiderio_data.get("name")}:\n{e}')
+        await WarcraftCharacterWeeklyRunsInterface.add_runs(runs)
+        if cycle_id is not None:
+            await WarcraftCrawlCheckpointInterface.record_attempts(
+                cycle_id, [(*attempt, True) for _, _, attempt in items])
 
     async def build_character_embed(self, r):  # r is raiderio_data
         """
@@ -871,12 +1106,14 @@ class Warcraft(commands.Cog):
         return embed
 
     @staticmethod
-    async def build_readycheck_msg(guild_members: List[WarcraftCharacter], sort_by):
+    async def build_readycheck_msg(guild_members: List[CharacterRow], sort_by,
+                                   run_counts):
         """
         Builds the readycheck layout.
 
-        :param guild_members: A list of WarcraftCharacter objects
+        :param guild_members: A list of CharacterRow tuples
         :param sort_by: rank (default), name, class, hoa, mplus, ilvl
+        :param run_counts: A dict of character name: number of weekly runs
         :return: A layout with the sorted list of characters and relevant information
         """
         if len(guild_members) == 0:
@@ -937,7 +1174,7 @@ class Warcraft(commands.Cog):
         for char in guild_members:
             total_ilvl += char.ilvl
             member_count += 1
-            num_runs = len(await WarcraftCharacterWeeklyRunsInterface.get_player_runs(char.name.lower()))
+            num_runs = run_counts.get(char.name.lower(), 0)
             output += (
                 f'{char.name.title():{name_col_width}}{col_sep}'
                 f'{char.m_plus_weekly_high:<{mplus_col_width}}{col_sep}'
@@ -1056,7 +1293,7 @@ class Warcraft(commands.Cog):
         """
         Builds the callout layout.
 
-        :param guild_members: A list of WarcraftCharacter objects
+        :param guild_members: A list of CharacterRow tuples
         :return: An output with the offending players if any, otherwise a congratulatory
         message
         """
@@ -1082,7 +1319,7 @@ class Warcraft(commands.Cog):
         """
         Builds the mythic+ keys information layout.
 
-        :param guild_members: A list of WarcraftCharacter objects
+        :param guild_members: A list of CharacterRow tuples
         :return: An output with mythic+ keys information for the default guild for the
         discord server.
         """
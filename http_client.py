@@ -0,0 +1,102 @@
+"""
+File: http_client.py
+
+This file sets up the single aiohttp client shared by the bot, its cogs and Utilities.
+Connections are pooled per host and kept alive between requests, DNS lookups are
+cached, responses are requested compressed, and pool usage is tracked so it can be
+inspected at runtime.
+"""
+
+from collections import Counter
+
+import aiohttp
+
+try:  # aiohttp only decodes brotli responses when one of these is installed
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+
+class HttpClient:
+    def __init__(self, limit=100, limit_per_host=10, keepalive_timeout=60,
+                 dns_cache_ttl=300, timeout=30):
+        """
+        :param limit: Max open connections across all hosts
+        :param limit_per_host: Max open connections to a single host
+        :param keepalive_timeout: Seconds an idle connection is kept for reuse
+        :param dns_cache_ttl: Seconds a resolved host address is cached
+        :param timeout: Total seconds allowed for a single request
+        """
+        self.requests = Counter()
+        self.connections_created = Counter()
+        self.connections_reused = Counter()
+        self.connections_queued = Counter()  # requests that waited for a free connection
+        self.in_flight = Counter()
+        self.peak_in_flight = Counter()
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_done)
+        trace_config.on_request_exception.append(self._on_request_done)
+        trace_config.on_connection_queued_start.append(self._on_connection_queued)
+        trace_config.on_connection_create_end.append(self._on_connection_created)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+
+        self.connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout,
+            ttl_dns_cache=dns_cache_ttl,
+            use_dns_cache=True,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(
+            connector=self.connector,
+            headers={'Accept-Encoding': ACCEPT_ENCODING},
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            trace_configs=[trace_config]
+        )
+
+    async def _on_request_start(self, session, context, params):
+        context.host = params.url.host
+        self.requests[context.host] += 1
+        self.in_flight[context.host] += 1
+        self.peak_in_flight[context.host] = max(self.peak_in_flight[context.host],
+                                                self.in_flight[context.host])
+
+    async def _on_request_done(self, session, context, params):
+        self.in_flight[context.host] -= 1
+
+    async def _on_connection_queued(self, session, context, params):
+        self.connections_queued[getattr(context, 'host', None)] += 1
+
+    async def _on_connection_created(self, session, context, params):
+        self.connections_created[getattr(context, 'host', None)] += 1
+
+    async def _on_connection_reused(self, session, context, params):
+        self.connections_reused[getattr(context, 'host', None)] += 1
+
+    def metrics(self):
+        """
+        Summarizes request counts and connection pool usage per host, as seen by the
+        trace hooks. The pool limits they are measured against are the connector's
+        limit and limit_per_host.
+
+        :return: A dict of host: dict of requests, new/reused connections, requests
+        that queued for a connection, and requests in flight now and at the peak
+        """
+        return {host: {'requests': self.requests[host],
+                       'created': self.connections_created[host],
+                       'reused': self.connections_reused[host],
+                       'queued': self.connections_queued[host],
+                       'in_flight': self.in_flight[host],
+                       'peak': self.peak_in_flight[host]}
+                for host in sorted(self.requests, key=str)}
+
+    async def close(self):
+        await self.session.close()
@@ -0,0 +1,125 @@
+"""
+File: rate_limits.py
+
+This file contains the process-wide rate limiter used for all outbound API traffic.
+Each host gets its own token bucket, and callers waiting on a bucket are queued in one
+of two lanes so interactive commands are always served before background crawls.
+"""
+
+import asyncio
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class TokenBucket:
+    """
+    A token bucket for a single host. Tokens refill continuously at `rate` per second
+    up to `capacity`. Background requests leave `reserve` tokens in the bucket so an
+    interactive request arriving mid-crawl can usually go out immediately.
+    """
+
+    def __init__(self, rate, capacity, reserve=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.reserve = reserve
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.waiters = (deque(), deque())  # indexed by INTERACTIVE / BACKGROUND
+        self._drainer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _available(self, priority):
+        if priority == INTERACTIVE:
+            return self.tokens >= 1
+        return self.tokens >= 1 + self.reserve
+
+    async def acquire(self, priority=INTERACTIVE):
+        """
+        Waits until a token is available for the given lane and takes it.
+
+        :param priority: INTERACTIVE or BACKGROUND
+        :return: None
+        """
+        self._refill()
+        if self._available(priority) and not any(self.waiters[:priority + 1]):
+            self.tokens -= 1
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters[priority].append(waiter)
+        if self._drainer is None or self._drainer.done():
+            self._drainer = asyncio.ensure_future(self._drain())
+        await waiter
+
+    async def _drain(self):
+        """
+        Hands out tokens to queued callers as they refill, interactive lane first.
+
+        :return: None
+        """
+        while any(self.waiters):
+            for lane in self.waiters:
+                while lane and lane[0].done():  # cancelled callers
+                    lane.popleft()
+            self._refill()
+            for priority, lane in enumerate(self.waiters):
+                if lane and self._available(priority):
+                    self.tokens -= 1
+                    lane.popleft().set_result(None)
+                    break
+            else:
+                if any(self.waiters):
+                    await asyncio.sleep(1 / self.rate)
+
+    @property
+    def queued(self):
+        return tuple(len(lane) for lane in self.waiters)
+
+
+class HostRateLimiter:
+    """
+    Keeps one TokenBucket per host. Hosts without an explicit limit share the default
+    settings but still get a bucket of their own.
+    """
+
+    def __init__(self, limits=None, default=(5, 10)):
+        """
+        :param limits: A dict of hostname: (requests per second, burst capacity)
+        :param default: (requests per second, burst capacity) for any other host
+        """
+        self.limits = limits or {}
+        self.default = default
+        self.buckets = {}
+
+    def bucket(self, url):
+        host = urlparse(url).hostname or ''
+        if host not in self.buckets:
+            rate, capacity = self.limits.get(host, self.default)
+            self.buckets[host] = TokenBucket(rate, capacity)
+        return self.buckets[host]
+
+    async def acquire(self, url, priority=INTERACTIVE):
+        """
+        Waits for the host's budget before a request to `url` is sent.
+
+        :param url: The url about to be requested
+        :param priority: INTERACTIVE for user commands, BACKGROUND for crawls/pollers
+        :return: None
+        """
+        await self.bucket(url).acquire(priority)
+
+
+host_rate_limiter = HostRateLimiter(limits={
+    'raider.io': (2, 5),  # 120 requests/minute
+    'us.api.blizzard.com': (10, 20),  # 36,000 requests/hour
+    'us.battle.net': (1, 5),
+    'api.twitch.tv': (12, 30),  # 800 points/minute
+    'id.twitch.tv': (1, 5),
+})
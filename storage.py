@@ -0,0 +1,102 @@
+"""
+File: storage.py
+
+This file contains the pieces shared by every cog's database layer. SQLAlchemy and
+sqlite3 are blocking, so all database work is handed to a single dedicated thread
+instead of running on the event loop, where a slow commit would stall the discord
+heartbeat and every other command. One thread also means SQLite only ever sees one
+writer from this process at a time.
+
+Every database file is opened through get_engine(), which hands out one engine per
+file, however the path is spelled. journal_mode is stored in the database file, so it
+is set once when the engine is created; the other pragmas below only last as long as
+a connection and are applied to each new one:
+
+Pragma        Value    Gain                                  Cost
+------------  -------  ------------------------------------  ---------------------------
+journal_mode  WAL      Readers don't block the writer and    Extra -wal/-shm files next
+                       vice versa; commits append to the     to the database; the WAL
+                       WAL instead of rewriting pages.       is checkpointed on its own.
+synchronous   NORMAL   No fsync per commit, only at WAL      A power loss (not a crash
+                       checkpoints.                          of the bot) can drop the
+                                                             last commits. The DB stays
+                                                             consistent.
+busy_timeout  5000 ms  A locked database is retried for up   A stuck writer delays the
+                       to 5s instead of raising "database    caller by up to 5s before
+                       is locked" immediately.               the error surfaces.
+cache_size    -20000   ~20 MB page cache per connection      Memory, per open
+                       keeps the hot roster in memory.       connection.
+mmap_size     256 MB   Reads are served from the OS page     Address space; an I/O error
+                       cache without copying.                on the file raises SIGBUS
+                                                             instead of an error code.
+temp_store    MEMORY   Sorts/temp b-trees (ORDER BY, GROUP   Memory for large sorts.
+                       BY) never touch disk.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import SingletonThreadPool
+
+JOURNAL_MODE = 'WAL'
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+_engines = {}
+
+db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='casper-db')
+
+
+def runs_in_db_thread(func):
+    """
+    Turns a blocking database function into a coroutine function that runs it on the
+    database thread. The wrapped function keeps its name, arguments and return value,
+    so callers keep awaiting it exactly as before.
+
+    :param func: The blocking function
+    :return: The coroutine function
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(db_executor,
+                                          functools.partial(func, *args, **kwargs))
+    return wrapper
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {pragma}={value}')
+    cursor.close()
+
+
+def get_engine(path):
+    """
+    Returns the shared engine for a SQLite database file, creating it on first use.
+    Each thread keeps one open connection, and all queries run on the database thread,
+    so in practice every Session of a file reuses a single connection and the pragmas
+    are applied once rather than once per Session.
+
+    :param path: Path to the database file
+    :return: A SQLAlchemy engine
+    """
+    path = os.path.abspath(path)
+    if path not in _engines:
+        engine = create_engine(f'sqlite:///{path}',
+                               echo=False,
+                               poolclass=SingletonThreadPool,
+                               connect_args={'check_same_thread': False})
+        event.listen(engine, 'connect', _apply_sqlite_pragmas)
+        with engine.connect() as connection:
+            connection.execute(text(f'PRAGMA journal_mode={JOURNAL_MODE}'))
+        _engines[path] = engine
+    return _engines[path]
@@ -0,0 +1,11 @@
+"""
+File: conftest.py
+
+Puts the repository root on sys.path, so the tests import cogs, cache and storage the
+same way casper.py does when the bot is started from the root.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
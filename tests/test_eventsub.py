@@ -0,0 +1,195 @@
+"""
+File: test_eventsub.py
+
+Drives EventSubReceiver with a fake local EventSub sender that signs its requests the
+way Twitch does, independently of eventsub.sign_message.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from cogs.twitch.eventsub import EventSubReceiver
+
+SECRET = 'local-eventsub-secret'
+PATH = '/twitch/eventsub'
+
+
+class FakeEventSubSender:
+    def __init__(self, client, secret=SECRET):
+        """
+        :param client: An aiohttp TestClient serving the receiver's app
+        :param secret: The secret the messages are signed with
+        """
+        self.client = client
+        self.secret = secret
+
+    async def send(self, message_type, payload, message_id=None, sent_at=None,
+                   signature=None, body=None):
+        """
+        Posts a message with the headers Twitch sends. The signature is the HMAC-SHA256
+        of the message id, the timestamp and the raw body, keyed with the secret.
+
+        :param message_type: notification, webhook_callback_verification or revocation
+        :param payload: The JSON payload, ignored if body is given
+        :param message_id: Defaults to a new uuid
+        :param sent_at: Defaults to now, as an aware UTC datetime
+        :param signature: Overrides the computed signature
+        :param body: Raw bytes to send instead of the encoded payload
+        :return: The aiohttp response
+        """
+        message_id = message_id or str(uuid.uuid4())
+        sent_at = sent_at or datetime.now(timezone.utc)
+        # Twitch sends nanosecond precision, e.g. 2023-01-01T00:00:00.123456789Z
+        timestamp = sent_at.strftime('%Y-%m-%dT%H:%M:%S.%f') + '123Z'
+        if body is None:
+            body = json.dumps(payload).encode()
+        if signature is None:
+            digest = hmac.new(self.secret.encode(),
+                              message_id.encode() + timestamp.encode() + body,
+                              hashlib.sha256).hexdigest()
+            signature = f'sha256={digest}'
+        headers = {'Twitch-Eventsub-Message-Id': message_id,
+                   'Twitch-Eventsub-Message-Timestamp': timestamp,
+                   'Twitch-Eventsub-Message-Signature': signature,
+                   'Twitch-Eventsub-Message-Type': message_type,
+                   'Content-Type': 'application/json'}
+        return await self.client.post(PATH, data=body, headers=headers)
+
+    async def notify(self, subscription_type, event, **kwargs):
+        payload = {'subscription': {'id': str(uuid.uuid4()), 'type': subscription_type,
+                                    'version': '1', 'status': 'enabled'},
+                   'event': event}
+        return await self.send('notification', payload, **kwargs)
+
+
+def run_with_sender(scenario, on_online=None, on_offline=None):
+    """
+    Starts a receiver on a local test server and runs scenario(sender, receiver, calls).
+
+    :param scenario: Coroutine function running the requests and assertions
+    :param on_online: Replaces the callback that records stream.online events
+    :param on_offline: Replaces the callback that records stream.offline events
+    :return: None
+    """
+    calls = []
+
+    async def record_online(event):
+        calls.append(('online', event['broadcaster_user_login']))
+
+    async def record_offline(event):
+        calls.append(('offline', event['broadcaster_user_login']))
+
+    async def main():
+        receiver = EventSubReceiver(SECRET, on_online or record_online,
+                                    on_offline or record_offline, path=PATH)
+        client = TestClient(TestServer(receiver.app))
+        await client.start_server()
+        try:
+            await scenario(FakeEventSubSender(client), receiver, calls)
+        finally:
+            await client.close()
+
+    asyncio.run(main())
+
+
+def test_challenge_is_echoed():
+    async def scenario(sender, receiver, calls):
+        payload = {'challenge': 'pogchamp-kappa-360noscope',
+                   'subscription': {'type': 'stream.online', 'status':
+                                    'webhook_callback_verification_pending'}}
+        resp = await sender.send('webhook_callback_verification', payload)
+        assert resp.status == 200
+        assert resp.content_type == 'text/plain'
+        assert await resp.text() == 'pogchamp-kappa-360noscope'
+
+    run_with_sender(scenario)
+
+
+def test_bad_signature_is_rejected():
+    async def scenario(sender, receiver, calls):
+        resp = await sender.notify('stream.online', {'broadcaster_user_login': 'a'},
+                                   signature='sha256=' + '0' * 64)
+        assert resp.status == 403
+        wrong_secret = FakeEventSubSender(sender.client, secret='not-the-secret')
+        resp = await wrong_secret.notify('stream.online', {'broadcaster_user_login': 'a'})
+        assert resp.status == 403
+        assert calls == []
+
+    run_with_sender(scenario)
+
+
+def test_stale_timestamp_is_rejected():
+    async def scenario(sender, receiver, calls):
+        sent_at = datetime.now(timezone.utc) - timedelta(
+            seconds=receiver.max_message_age + 60)
+        resp = await sender.notify('stream.online', {'broadcaster_user_login': 'a'},
+                                   sent_at=sent_at)
+        assert resp.status == 403
+        assert calls == []
+
+    run_with_sender(scenario)
+
+
+def test_duplicate_message_id_is_handled_once():
+    async def scenario(sender, receiver, calls):
+        event = {'broadcaster_user_login': 'a'}
+        first = await sender.notify('stream.online', event, message_id='dup')
+        retry = await sender.notify('stream.online', event, message_id='dup')
+        assert first.status == 204
+        assert retry.status == 204
+        assert calls == [('online', 'a')]
+
+    run_with_sender(scenario)
+
+
+def test_online_and_offline_are_dispatched():
+    async def scenario(sender, receiver, calls):
+        resp = await sender.notify('stream.online', {'broadcaster_user_login': 'a'})
+        assert resp.status == 204
+        resp = await sender.notify('stream.offline', {'broadcaster_user_login': 'b'})
+        assert resp.status == 204
+        resp = await sender.notify('channel.follow', {'broadcaster_user_login': 'c'})
+        assert resp.status == 204
+        assert calls == [('online', 'a'), ('offline', 'b')]
+
+    run_with_sender(scenario)
+
+
+def test_malformed_messages_return_400():
+    async def scenario(sender, receiver, calls):
+        resp = await sender.send('notification', None, body=b'{not json')
+        assert resp.status == 400
+        resp = await sender.send('notification', {'event': {}})
+        assert resp.status == 400
+        resp = await sender.send('webhook_callback_verification', {'subscription': {}})
+        assert resp.status == 400
+        resp = await sender.send('notification', ['not', 'an', 'object'])
+        assert resp.status == 400
+        assert calls == []
+
+    run_with_sender(scenario)
+
+
+def test_failed_callback_is_retried():
+    attempts = []
+
+    async def flaky_online(event):
+        attempts.append(event['broadcaster_user_login'])
+        if len(attempts) == 1:
+            raise RuntimeError('discord is down')
+
+    async def scenario(sender, receiver, calls):
+        event = {'broadcaster_user_login': 'a'}
+        first = await sender.notify('stream.online', event, message_id='retry')
+        retry = await sender.notify('stream.online', event, message_id='retry')
+        assert first.status == 500
+        assert retry.status == 204
+        assert attempts == ['a', 'a']
+
+    run_with_sender(scenario, on_online=flaky_online)
@@ -0,0 +1,178 @@
+"""
+File: test_storage.py
+
+Runs the Warcraft interfaces against a temporary database: event loop lag while a
+write-heavy crawl runs, batches of character upserts and weekly run inserts once on the
+database thread through runs_in_db_thread and once directly on the loop as the control,
+and the guard that keeps a partial guild roster from emptying the guild.
+"""
+
+import asyncio
+import sys
+import time
+
+import pytest
+
+TICK = 0.005
+ROUNDS = 5
+
+
+@pytest.fixture
+def warcraft_db(tmp_path, monkeypatch):
+    """
+    Imports the Warcraft interfaces with the working directory set to tmp_path, so
+    their engine opens tmp_path/cogs/warcraft/database/database.db. The modules are
+    unloaded afterwards so the next test binds a fresh database.
+
+    :return: A tuple of (WarcraftCharacterInterface, WarcraftCharacterWeeklyRunsInterface)
+    """
+    assert 'cogs.warcraft.database.db_engine_session_init' not in sys.modules, \
+        'the Warcraft engine is already bound to another database'
+    (tmp_path / 'cogs' / 'warcraft' / 'database').mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    from cogs.warcraft.db_interfaces.warcraft_character_iface import WarcraftCharacterInterface
+    from cogs.warcraft.db_interfaces.weekly_gulld_runs_iface import WarcraftCharacterWeeklyRunsInterface
+    yield WarcraftCharacterInterface, WarcraftCharacterWeeklyRunsInterface
+    sys.modules['cogs.warcraft.database.db_engine_session_init'].engine.dispose()
+    for module in [module for module in sys.modules
+                   if module.startswith('cogs.warcraft.')]:
+        del sys.modules[module]
+
+
+def raiderio_profile(i, crawl):
+    runs = [{'dungeon': 'Halls of Atonement', 'mythic_level': 10 + run,
+             'url': f'https://raider.io/mythic-plus-runs/season-sl-2/{crawl}{i}{run}-10'}
+            for run in range(3)]
+    return {'name': f'Character{i}', 'realm': 'Wyrmrest Accord', 'region': 'us',
+            'guild': {'name': 'Felforged'}, 'class': 'Mage',
+            'gear': {'item_level_equipped': 400 + crawl},
+            'mythic_plus_scores_by_season': [{'scores': {'all': 2000 + crawl}}],
+            'mythic_plus_ranks': {'overall': {'realm': i}, 'class': {'realm': i}},
+            'mythic_plus_weekly_highest_level_runs': runs,
+            'mythic_plus_previous_weekly_highest_level_runs': runs,
+            'covenant': None}
+
+
+def crawl_batch(characters_iface, runs_iface, crawl, size, blocking):
+    """
+    Builds the two writes write_crawl_batch makes for one batch of crawled characters.
+
+    :param crawl: Number of the crawl, so each one changes every row and adds new runs
+    :param size: Characters in the batch
+    :param blocking: Call the undecorated functions on the calling thread
+    :return: A list of zero-argument functions, or of coroutine functions if not
+    blocking, doing the upsert and then the runs insert
+    """
+    payloads = [(raiderio_profile(i, crawl), i % 10) for i in range(size)]
+    runs = [{'run_id': f'{crawl}-{i}-{run["mythic_level"]}',
+             'character_name': data['name'], 'dungeon_name': run['dungeon'],
+             'dungeon_level': run['mythic_level']}
+            for i, (data, _) in enumerate(payloads)
+            for run in data['mythic_plus_weekly_highest_level_runs']]
+    upsert = characters_iface.bulk_update_characters
+    insert = runs_iface.add_runs
+    if blocking:
+        return [lambda: upsert.__wrapped__(characters_iface, payloads, report=False),
+                lambda: insert.__wrapped__(runs_iface, runs)]
+    return [lambda: upsert(payloads, report=False), lambda: insert(runs)]
+
+
+async def max_tick_lag(work):
+    """
+    Runs a ticker that wakes every TICK seconds alongside work.
+
+    :param work: Coroutine to run while the ticker measures the loop
+    :return: A tuple of (result of work, worst lateness of a tick in seconds)
+    """
+    worst = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal worst
+        while not done:
+            expected = time.perf_counter() + TICK
+            await asyncio.sleep(TICK)
+            worst = max(worst, time.perf_counter() - expected)
+
+    ticks = asyncio.ensure_future(ticker())
+    await asyncio.sleep(TICK * 2)  # let the ticker settle before the writes start
+    try:
+        result = await work
+    finally:
+        done = True
+        await ticks
+    return result, worst
+
+
+def test_db_thread_keeps_event_loop_responsive_during_crawl_writes(warcraft_db):
+    characters_iface, runs_iface = warcraft_db
+    crawl = 0
+    size = 250
+    # Grow the batch until one batch blocks for long enough to measure against
+    while True:
+        crawl += 1
+        started = time.perf_counter()
+        for write in crawl_batch(characters_iface, runs_iface, crawl, size, True):
+            write()
+        if time.perf_counter() - started > 0.2:
+            break
+        size *= 2
+
+    def batches(blocking):
+        nonlocal crawl
+        crawl += ROUNDS
+        return [crawl_batch(characters_iface, runs_iface, crawl - round_, size, blocking)
+                for round_ in range(ROUNDS)]
+
+    async def crawl_writes(batches, blocking):
+        written = 0
+        for upsert, insert in batches:  # built up front, only the writes are measured
+            if blocking:
+                written += upsert()
+                assert insert()
+            else:
+                written += await upsert()
+                assert await insert()
+            await asyncio.sleep(0)  # the crawl yields between batches
+        return written
+
+    async def main():
+        on_loop = await max_tick_lag(crawl_writes(batches(True), True))
+        off_loop = await max_tick_lag(crawl_writes(batches(False), False))
+        rows = len(await characters_iface.get_all_characters())
+        runs = len(await runs_iface.get_player_runs('character0'))
+        return on_loop, off_loop, rows, runs
+
+    (on_loop_written, on_loop_lag), (off_loop_written, off_loop_lag), rows, runs = \
+        asyncio.run(main())
+    assert on_loop_written == off_loop_written == ROUNDS * size
+    assert rows == size
+    assert runs == 3 * crawl
+    print(f'\n{ROUNDS} crawl batches of {size} characters and {3 * size} runs, '
+          f'worst tick lag: {on_loop_lag * 1000:.1f} ms on the loop, '
+          f'{off_loop_lag * 1000:.1f} ms via runs_in_db_thread')
+    assert on_loop_lag > 0.15
+    # SQLAlchemy builds the statement parameters in Python on the database thread, so
+    # the loop still waits on the GIL now and then, but never for a whole batch
+    assert off_loop_lag < min(0.1, on_loop_lag / 10)
+
+
+def test_roster_sync_skips_empty_or_implausible_roster(warcraft_db):
+    characters_iface, _ = warcraft_db
+    roster = [(f'Character{i}', 'Wyrmrest Accord', i % 10) for i in range(10)]
+
+    async def main():
+        joined = await characters_iface.sync_guild_roster('Felforged', 'us', roster)
+        empty = await characters_iface.sync_guild_roster('Felforged', 'us', [])
+        partial = await characters_iface.sync_guild_roster('Felforged', 'us', roster[:4])
+        departed = await characters_iface.sync_guild_roster('Felforged', 'us', roster[:8])
+        members = await characters_iface.get_guild_members(
+            'Felforged', 'wyrmrest-accord', 'us')
+        return joined, empty, partial, departed, members
+
+    joined, empty, partial, departed, members = asyncio.run(main())
+    assert len(joined.joined) == 10
+    assert empty is None
+    assert partial is None
+    assert [key[0] for key in departed.left] == ['character8', 'character9']
+    assert len(members) == 8
@@ -0,0 +1,67 @@
+"""
+File: test_utilities.py
+
+Runs Utilities.json_get_status against a local aiohttp server that answers too slowly
+or with bodies that are not json.
+"""
+
+import asyncio
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from utilities import Utilities
+
+
+def run_against_server(scenario):
+    """
+    Serves /slow, /html, /broken and /ok locally and runs scenario(utilities, url).
+
+    :param scenario: Coroutine function running the requests and assertions
+    :return: None
+    """
+    async def slow(request):
+        await asyncio.sleep(1)
+        return web.json_response({'name': 'late'})
+
+    async def html(request):
+        return web.Response(text='<html>Bad gateway</html>', content_type='text/html')
+
+    async def broken(request):
+        return web.Response(text='{"name": ', content_type='application/json')
+
+    async def ok(request):
+        return web.json_response({'name': 'casper'})
+
+    async def main():
+        app = web.Application()
+        for path, handler in (('/slow', slow), ('/html', html), ('/broken', broken),
+                              ('/ok', ok)):
+            app.router.add_get(path, handler)
+        server = TestServer(app)
+        await server.start_server()
+        session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=0.2))
+        try:
+            await scenario(Utilities(session), lambda path: str(server.make_url(path)))
+        finally:
+            await session.close()
+            await server.close()
+
+    asyncio.run(main())
+
+
+def test_timeout_is_reported_as_failed_request():
+    async def scenario(utilities, url):
+        assert await utilities.json_get_status(url('/slow')) == (None, None)
+
+    run_against_server(scenario)
+
+
+def test_non_json_200_is_reported_as_failed_request():
+    async def scenario(utilities, url):
+        assert await utilities.json_get_status(url('/html')) == (None, None)
+        assert await utilities.json_get_status(url('/broken')) == (None, None)
+        assert await utilities.json_get_status(url('/ok')) == (200, {'name': 'casper'})
+
+    run_against_server(scenario)
@@ -6,24 +6,29 @@ Usually covers things such as boilerplate code that can be annoying to have to r
 each time you want to perform that process.
 """
 
+import asyncio
 from datetime import datetime
 from dateutil.tz import tz
 
 import aiohttp
 
+from rate_limits import host_rate_limiter, INTERACTIVE
+
 
 class Utilities:
     def __init__(self, aiohttp_session):
         self.aiohttp_session = aiohttp_session
 
-    async def json_get(self, url, headers=None):
+    async def json_get(self, url, headers=None, priority=INTERACTIVE):
         """
         Asynchronous method to fetch API results as json.
 
         :param url: The url to make a GET request to.
         :param headers: Optional headers if additional info needs to be passed along
+        :param priority: Rate limiter lane, INTERACTIVE or BACKGROUND
         :return: The response if successful, otherwise None
         """
+        await host_rate_limiter.acquire(url, priority)
         if headers is None:
             async with self.aiohttp_session.get(url) as resp:
                 return await resp.json()
@@ -31,7 +36,35 @@ class Utilities:
             async with self.aiohttp_session.get(url, headers=headers) as resp:
                 return await resp.json()
 
-    async def json_post(self, url, auth=None, headers=None, data=None):
+    async def json_get_status(self, url, headers=None, priority=INTERACTIVE):
+        """
+        Asynchronous method to fetch API results as json along with the HTTP status
+        code, so callers can react to throttling (429) and server errors (5xx).
+
+        :param url: The url to make a GET request to.
+        :param headers: Optional headers if additional info needs to be passed along
+        :param priority: Rate limiter lane, INTERACTIVE or BACKGROUND
+        :return: A tuple of (status, json). The json is None unless the status is 200,
+        the status is None if the connection failed, timed out, or a 200 response was
+        not valid json (e.g. an error page from a proxy)
+        """
+        await host_rate_limiter.acquire(url, priority)
+        try:
+            async with self.aiohttp_session.get(url, headers=headers) as resp:
+                if resp.status == 200:
+                    return resp.status, await resp.json()
+                return resp.status, None
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            print(f'An error occurred while fetching data from {url}:\n'
+                  f'{e!r}')
+            return None, None
+        except (aiohttp.ContentTypeError, ValueError) as e:
+            print(f'Could not read the response from {url} as json:\n'
+                  f'{e}')
+            return None, None
+
+    async def json_post(self, url, auth=None, headers=None, data=None,
+                        priority=INTERACTIVE):
         """
         Asynchronous method to post API results as json.
 
@@ -39,8 +72,10 @@ class Utilities:
         :param auth: Optional authorization information
         :param headers: Optional headers if additional info needs to be passed along
         :param data: Optional data payload
+        :param priority: Rate limiter lane, INTERACTIVE or BACKGROUND
         :return: The response if successful, otherwise None
         """
+        await host_rate_limiter.acquire(url, priority)
         if headers is None:
             async with self.aiohttp_session.post(url) as resp:
                 return await resp.json()
@@ -48,14 +83,16 @@ class Utilities:
             async with self.aiohttp_session.post(url, headers=headers, auth=auth) as resp:
                 return await resp.json()
 
-    async def resp_get(self, url, headers=None):
+    async def resp_get(self, url, headers=None, priority=INTERACTIVE):
         """
         Asynchronous method to fetch API results as html.
 
         :param url: The url to make a GET request to.
         :param headers: Optional headers if additional info needs to be passed along
+        :param priority: Rate limiter lane, INTERACTIVE or BACKGROUND
         :return: The response if successful, otherwise None
         """
+        await host_rate_limiter.acquire(url, priority)
         if headers is None:
             try:
                 async with self.aiohttp_session.get(url) as resp: